@@ -0,0 +1,214 @@
+from dataclasses import dataclass, asdict
+import numpy as np
+import statistics
+import platform
+import datetime
+import pygame
+import time
+import json
+import os
+
+RESULTS_VERSION = 2
+DEFAULT_REPEATS = 25
+# Median slower (or faster) than baseline by more than this is reported as a change...
+CHANGE_THRESHOLD = 0.10
+# ...when the difference is also above this many interquartile ranges (run to run noise) of both results.
+NOISE_FACTOR = 2
+# Repeats of every benchmark are split into rounds over all benchmarks, so a temporary
+# slowdown of the machine affects only part of the run times of one benchmark.
+ROUNDS = 3
+
+
+@dataclass
+class Benchmark:
+    name: str
+    case_fn: object
+    repeats: int
+    # Calls of timed function per run (short benchmarks), run time is their average.
+    number: int
+    # Items processed by one call (e.g. delivered messages), reported per second.
+    items: int
+
+
+@dataclass
+class BenchmarkResult:
+    repeats: int
+    median: float
+    mean: float
+    min: float
+    max: float
+    stdev: float
+    # Quartiles of run times.
+    q1: float
+    q3: float
+    items_per_second: float | None = None
+
+
+benchmarks: list[Benchmark] = []
+
+
+def benchmark(name: str, repeats: int = DEFAULT_REPEATS, number: int = 1, items: int = 0):
+    """
+    Register benchmark case. Case is a generator: it prepares its state, yields
+    the function to time and cleans up after it. It can yield (prepare, run)
+    pair instead, `prepare` is called before every run and is not measured.
+    """
+    def register(case_fn):
+        benchmarks.append(Benchmark(name, case_fn, repeats, number, items))
+        return case_fn
+    return register
+
+
+def run_benchmark(bench: Benchmark, repeats: int) -> list[float]:
+    """ Run times of `repeats` runs of one case. """
+    case = bench.case_fn()
+    run = next(case)
+    prepare = None
+    if isinstance(run, tuple):
+        prepare, run = run
+    try:
+        times = []
+        # First run warms up caches (textures, flyweights, encoded frames) and is not counted.
+        for _ in range(repeats + 1):
+            if prepare is not None:
+                prepare()
+            started = time.perf_counter()
+            for _ in range(bench.number):
+                run()
+            times.append((time.perf_counter() - started) / bench.number)
+        times.pop(0)
+    finally:
+        case.close()
+    return times
+
+
+def summarize(bench: Benchmark, times: list[float]) -> BenchmarkResult:
+    median = statistics.median(times)
+    q1, _, q3 = statistics.quantiles(times, n=4) if len(times) > 1 else (median, median, median)
+    return BenchmarkResult(
+        len(times), median, statistics.mean(times), min(times), max(times),
+        statistics.stdev(times) if len(times) > 1 else 0, q1, q3,
+        bench.items / median if bench.items and median else None
+    )
+
+
+def get_machine_info() -> dict:
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pygame.version.ver,
+    }
+
+
+def run_all(name_filter: str = "", rounds: int = ROUNDS) -> dict:
+    """ Run benchmarks with `name_filter` in their name, returns results document. """
+    selected = [bench for bench in benchmarks if name_filter in bench.name]
+    times = {bench.name: [] for bench in selected}
+    for round_index in range(rounds):
+        print(f"Round {round_index + 1}/{rounds}")
+        for bench in selected:
+            if bench.name not in times:
+                continue
+            try:
+                times[bench.name] += run_benchmark(bench, -(-bench.repeats // rounds))
+            except Exception as error:
+                print(f"ERROR: Benchmark {bench.name} failed: {error!r}")
+                times.pop(bench.name)
+
+    results = {}
+    for bench in selected:
+        if bench.name not in times:
+            continue
+        result = summarize(bench, times[bench.name])
+        results[bench.name] = asdict(result)
+        throughput = f", {result.items_per_second:,.0f}/s" if result.items_per_second else ""
+        print(f"{bench.name:<36} {format_seconds(result.median):>10} (min {format_seconds(result.min)}, iqr {format_seconds(result.q3 - result.q1)}{throughput})")
+
+    return {
+        "version": RESULTS_VERSION,
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": get_machine_info(),
+        "benchmarks": results,
+    }
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 0.001:
+        return f"{seconds * 1000:.3f} ms"
+    return f"{seconds * 1_000_000:.1f} us"
+
+
+def save_results(results: dict, path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+        file.write("\n")
+
+
+def load_results(path: str) -> dict | None:
+    try:
+        with open(path) as file:
+            results = json.load(file)
+    except (OSError, ValueError) as error:
+        print(f"ERROR: Cannot load benchmark results {path}: {error}")
+        return None
+
+    if results.get("version") != RESULTS_VERSION:
+        print(f"ERROR: Unsupported benchmark results version in {path}: {results.get('version')}")
+        return None
+    return results
+
+
+def get_noise(result: dict) -> float:
+    """ Interquartile range of run times. """
+    return result["q3"] - result["q1"]
+
+
+def compare(baseline: dict, current: dict, threshold: float = CHANGE_THRESHOLD, noise_factor: float = NOISE_FACTOR) -> tuple[str, list[str]]:
+    """
+    Text report of median changes against baseline, returns it with names of regressed benchmarks.
+    Change is reported only above `threshold` and above `noise_factor` times the noise of both results.
+    """
+    lines = [
+        f"Baseline: {baseline['time']} ({baseline['machine']['processor']}, Python {baseline['machine']['python']})",
+        f"Current:  {current['time']} ({current['machine']['processor']}, Python {current['machine']['python']})",
+    ]
+    if baseline["machine"] != current["machine"]:
+        lines.append("WARNING: Results come from different machines or library versions.")
+    lines.append(f"Changes are reported above {threshold:.0%} of baseline median and above noise ({noise_factor} x interquartile ranges).")
+    lines.append("")
+    lines.append(f"{'benchmark':<36} {'baseline':>12} {'current':>12} {'change':>9} {'noise':>8}")
+
+    regressions = []
+    for name, result in current["benchmarks"].items():
+        base_result = baseline["benchmarks"].get(name)
+        if base_result is None:
+            lines.append(f"{name:<36} {'-':>12} {format_seconds(result['median']):>12} {'new':>9}")
+            continue
+
+        difference = result["median"] - base_result["median"]
+        change = difference / base_result["median"]
+        # Relative to baseline median, like `change`.
+        noise = noise_factor * (get_noise(base_result) + get_noise(result)) / base_result["median"]
+        status = ""
+        if abs(change) > threshold and abs(change) > noise:
+            if change > 0:
+                status = "  SLOWER"
+                regressions.append(name)
+            else:
+                status = "  faster"
+        lines.append(
+            f"{name:<36} {format_seconds(base_result['median']):>12} "
+            f"{format_seconds(result['median']):>12} {change:>+8.1%} {noise:>7.1%}{status}"
+        )
+
+    for name in sorted(baseline["benchmarks"].keys() - current["benchmarks"].keys()):
+        lines.append(f"{name:<36} {format_seconds(baseline['benchmarks'][name]['median']):>12} {'-':>12} {'missing':>9}")
+    return "\n".join(lines), regressions
@@ -0,0 +1,56 @@
+from modules import map_cache
+from modules import perlin
+from modules import world
+
+from benchmarks.bench import benchmark
+from contextlib import contextmanager
+import tempfile
+
+
+@contextmanager
+def empty_map_cache():
+    """ Point map cache to a new temporary directory for the duration of the case. """
+    previous_dir = map_cache.CACHE_DIR
+    with tempfile.TemporaryDirectory() as cache_dir:
+        map_cache.CACHE_DIR = cache_dir
+        try:
+            yield cache_dir
+        finally:
+            map_cache.CACHE_DIR = previous_dir
+
+
+for size in [100, 250, 500]:
+    @benchmark(f"perlin/generate-{size}")
+    def perlin_map(size=size):
+        yield lambda: perlin.generate_perlin_map(size, size, 42)
+
+
+for size in [100, 250]:
+    @benchmark(f"world/init-{size}")
+    def world_init(size=size):
+        # New cache directory for every run: whole generation is measured, not cache loading.
+        with empty_map_cache() as cache_root:
+            def prepare() -> None:
+                map_cache.CACHE_DIR = tempfile.mkdtemp(dir=cache_root)
+            yield prepare, lambda: world.World(size, size, 42)
+
+
+for size in [100, 250]:
+    @benchmark(f"world/init-cached-{size}")
+    def world_init_cached(size=size):
+        with empty_map_cache():
+            yield lambda: world.World(size, size, 42)
+
+
+@benchmark("world/init-chunked-2000")
+def world_init_chunked():
+    # Layers are generated lazily, so a cell is read to generate its chunks.
+    with empty_map_cache() as cache_root:
+        def prepare() -> None:
+            map_cache.CACHE_DIR = tempfile.mkdtemp(dir=cache_root)
+
+        def run() -> None:
+            game_world = world.World(2000, 2000, 42)
+            game_world.ground.is_walkable(1000, 1000)
+            game_world.env_layer[1000][1000]
+        yield prepare, run
@@ -0,0 +1,90 @@
+from modules import protocol
+from modules import headers
+from modules import codec
+from modules import match
+
+from benchmarks.bench import benchmark
+import asyncio
+
+HOST = "127.0.0.1"
+MESSAGES_PER_RUN = 200
+DELIVERY_TIMEOUT = 30
+
+
+class FakeClient:
+    """ Loopback connection counting frames received from the match server. """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.received = 0
+        self.expected = 0
+        self.is_done = asyncio.Event()
+
+    async def receive(self) -> None:
+        decoder = protocol.FrameDecoder()
+        while data := await self.reader.read(headers.CONN_BUFSIZE):
+            decoder.feed(data)
+            self.received += sum(1 for _ in decoder.frames())
+            if self.received >= self.expected:
+                self.is_done.set()
+
+    def expect(self, frames: int) -> None:
+        self.expected += frames
+        if self.received < self.expected:
+            self.is_done.clear()
+
+
+async def connect_clients(game_match: match.Match, clients_amount: int, codec_name: str) -> tuple[asyncio.Server, list[FakeClient]]:
+    """
+    Register `clients_amount` clients with the match (more than regular player
+    colors, so every client gets its own name) connected through loopback TCP.
+    """
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        handler = match.ClientHandler(game_match, reader, writer)
+        handler.color = f"client-{len(game_match.clients)}"
+        handler.codec_name = codec_name
+        handler.sender_task = asyncio.create_task(handler.sender())
+        game_match.clients[handler.color] = handler
+
+    server = await asyncio.start_server(handle_connection, HOST, 0)
+    port = server.sockets[0].getsockname()[1]
+
+    clients = []
+    for _ in range(clients_amount):
+        reader, writer = await asyncio.open_connection(HOST, port)
+        clients.append(FakeClient(reader, writer))
+    while len(game_match.clients) < clients_amount:
+        await asyncio.sleep(0.001)
+    return server, clients
+
+
+async def spread_messages(game_match: match.Match, clients: list[FakeClient]) -> None:
+    """ Spread enemy updates and wait until every client received all of them. """
+    for client in clients:
+        client.expect(MESSAGES_PER_RUN)
+
+    for index in range(MESSAGES_PER_RUN):
+        game_match.spread_message(headers.ENEMY_UPDATE, {"color": "red", "x": index % 100, "y": 50, "facing": 90})
+    await asyncio.wait_for(asyncio.gather(*[client.is_done.wait() for client in clients]), DELIVERY_TIMEOUT)
+
+
+for codec_name in codec.SUPPORTED_CODECS:
+    for clients_amount in [8, 32, 128]:
+        @benchmark(f"server/fan-out-{codec_name}-{clients_amount}", items=clients_amount * MESSAGES_PER_RUN)
+        def server_fan_out(codec_name=codec_name, clients_amount=clients_amount):
+            """ `Match.spread_message` delivered to every client (messages per second are reported). """
+            loop = asyncio.new_event_loop()
+            game_match = match.Match(0, clients_amount, 50)
+            server, clients = loop.run_until_complete(connect_clients(game_match, clients_amount, codec_name))
+            receivers = [loop.create_task(client.receive()) for client in clients]
+            try:
+                yield lambda: loop.run_until_complete(spread_messages(game_match, clients))
+            finally:
+                for handler in game_match.clients.values():
+                    handler.close()
+                for client in clients:
+                    client.writer.close()
+                server.close()
+                loop.run_until_complete(asyncio.gather(*receivers, return_exceptions=True))
+                loop.run_until_complete(server.wait_closed())
+                loop.close()
@@ -0,0 +1,97 @@
+from modules import environment
+from modules import bullets
+from modules import player
+from modules import world
+
+from benchmarks.bench import benchmark
+import numpy as np
+import socket
+import pygame
+import random
+
+WORLD_SIZE = 200
+BULLETS_AMOUNT = 2000
+
+# Server ends of player connections, kept open so players never see the server stopping.
+server_ends: list[socket.socket] = []
+
+
+class BenchmarkPlayer(player.Player):
+    """ Player without input loop, frames are drawn only by explicit `draw_frame` calls. """
+    def input_handler(self) -> None:
+        pass
+
+    def render(self) -> None:
+        pass
+
+
+def make_player(game_world: world.World, color: str = "red") -> BenchmarkPlayer:
+    """ Started player connected to one end of a socket pair. """
+    client, server_end = socket.socketpair()
+    server_ends.append(server_end)
+    screen = pygame.display.set_mode((700, 700))
+    # Same view in every run.
+    random.seed(42)
+    bench_player = BenchmarkPlayer(screen, game_world, client, color, init_spawn=game_world.get_spawn_point())
+    bench_player.is_started = True
+    return bench_player
+
+
+def set_visibility(bench_player: BenchmarkPlayer, visibility: int) -> None:
+    """ Screen size of `Player.update_visibility`, without notifying the server. """
+    width_boost, height_boost = 0, visibility
+    if visibility > 7:
+        width_boost = (visibility - 7) * 100
+        height_boost = 7
+    screen_size = 200 + height_boost * 100
+    bench_player.visibility = visibility
+    bench_player.screen = pygame.display.set_mode((screen_size + width_boost, screen_size))
+
+
+for visibility in [5, 9, 13]:
+    @benchmark(f"render/full-frame-vis{visibility}", repeats=30)
+    def render_full_frame(visibility=visibility):
+        """ Whole screen redrawn (camera moved). """
+        bench_player = make_player(world.World(WORLD_SIZE, WORLD_SIZE, 42))
+        set_visibility(bench_player, visibility)
+
+        def run() -> None:
+            bench_player._last_frame = None
+            bench_player.draw_frame()
+        yield run
+
+    @benchmark(f"render/idle-frame-vis{visibility}", number=20)
+    def render_idle_frame(visibility=visibility):
+        """ Nothing changed since last frame (only diffing). """
+        bench_player = make_player(world.World(WORLD_SIZE, WORLD_SIZE, 42))
+        set_visibility(bench_player, visibility)
+        bench_player.draw_frame()
+        yield bench_player.draw_frame
+
+
+@benchmark("bullets/tick-2000")
+def bullets_tick():
+    """ `BulletsManager.tick` until all bullets are gone, env layer is restored before every run. """
+    game_world = world.World(WORLD_SIZE, WORLD_SIZE, 42)
+    bench_player = make_player(game_world)
+    env_layer = game_world.env_layer
+    rng = np.random.default_rng(42)
+    shots = list(zip(
+        rng.integers(0, WORLD_SIZE, BULLETS_AMOUNT).tolist(),
+        rng.integers(0, WORLD_SIZE, BULLETS_AMOUNT).tolist(),
+        (rng.integers(0, 8, BULLETS_AMOUNT) * 45).tolist()
+    ))
+    manager = bench_player.bullets_manager
+
+    def prepare() -> None:
+        game_world.env_layer = environment.EnvLayer(env_layer.height, env_layer.width, env_layer.types.copy(), env_layer.states.copy())
+        # Added directly to the pool, so the ticker thread of the manager stays idle.
+        # Bullets of other player: hits are not reported to the server.
+        manager.pool = bullets.BulletPool(BULLETS_AMOUNT)
+        for bullet_id, (x, y, direction) in enumerate(shots):
+            manager.pool.add(bullet_id, "blue", x, y, direction)
+
+    def run() -> None:
+        for _ in range(bullets.BULLET_MAX_MOVES + 1):
+            manager.tick()
+    yield prepare, run
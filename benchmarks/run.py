@@ -0,0 +1,101 @@
+"""
+Headless benchmark suite, run from the repository root:
+
+    python -m benchmarks.run save [filter]      run and store results as the baseline
+    python -m benchmarks.run [filter]           run and compare with the baseline
+    python -m benchmarks.run compare OLD NEW    compare two results files
+
+`filter` selects benchmarks containing it in their name (e.g. `render/`).
+Results are written to `benchmarks/results/`. Baseline is not part of the
+repository, timings depend on the machine: save it locally (e.g. on the
+main branch) before comparing. Exit code is 1 when some benchmark is slower
+than baseline (see `bench.compare`), 2 when there is no baseline to compare with.
+"""
+import os
+
+# Before pygame is imported by the benchmarked modules.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from modules import map_cache
+
+from benchmarks import serialization
+from benchmarks import generation
+from benchmarks import rendering
+from benchmarks import network
+from benchmarks import bench
+
+import datetime
+import tempfile
+import pygame
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+BASELINE_PATH = os.path.join(RESULTS_DIR, "baseline.json")
+
+
+def report(baseline: dict, current: dict, report_path: str) -> int:
+    text, regressions = bench.compare(baseline, current)
+    print()
+    print(text)
+    with open(report_path, "w") as file:
+        file.write(text + "\n")
+    print(f"\nReport saved to: {report_path}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    action = "run"
+    if args and args[0] in ("run", "save", "compare"):
+        action = args.pop(0)
+
+    if action == "compare":
+        if len(args) != 2:
+            print("ERROR: Usage: python -m benchmarks.run compare OLD NEW")
+            return 2
+        baseline, current = bench.load_results(args[0]), bench.load_results(args[1])
+        if baseline is None or current is None:
+            return 2
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        return report(baseline, current, os.path.join(RESULTS_DIR, "report.txt"))
+
+    if action == "run" and not os.path.exists(BASELINE_PATH):
+        print(f"ERROR: No baseline in {BASELINE_PATH}, save one first with: python -m benchmarks.run save")
+        return 2
+
+    name_filter = args[0] if args else ""
+    # Textures are loaded relative to the repository root.
+    os.chdir(os.path.dirname(BENCHMARKS_DIR))
+    pygame.init()
+
+    # Map cache of the game is neither used nor filled.
+    with tempfile.TemporaryDirectory() as cache_dir:
+        map_cache.CACHE_DIR = cache_dir
+        results = bench.run_all(name_filter)
+
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    results_path = os.path.join(RESULTS_DIR, f"results-{stamp}.json")
+    bench.save_results(results, results_path)
+    print(f"\nResults saved to: {results_path}")
+
+    if action == "save":
+        # Baseline keeps benchmarks which were not run now.
+        baseline = bench.load_results(BASELINE_PATH) if os.path.exists(BASELINE_PATH) else None
+        if baseline is not None and name_filter:
+            results["benchmarks"] = baseline["benchmarks"] | results["benchmarks"]
+        bench.save_results(results, BASELINE_PATH)
+        print(f"Baseline saved to: {BASELINE_PATH}")
+        return 0
+
+    baseline = bench.load_results(BASELINE_PATH)
+    if baseline is None:
+        return 2
+    baseline["benchmarks"] = {name: result for name, result in baseline["benchmarks"].items() if name_filter in name}
+    return report(baseline, results, os.path.join(RESULTS_DIR, f"report-{stamp}.txt"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+from modules import environment
+from modules import snapshot
+from modules import world
+
+from benchmarks.bench import benchmark
+
+WORLD_SIZE = 250
+
+
+def get_env_voxels(game_world: world.World) -> list[environment.EnvVoxel]:
+    return [env_voxel for env_row in game_world.env_layer for env_voxel in env_row if env_voxel is not None]
+
+
+@benchmark("world/to-dict-250", number=5)
+def world_to_dict():
+    game_world = world.World(WORLD_SIZE, WORLD_SIZE, 42)
+    yield game_world.to_dict
+
+
+@benchmark("world/import-env-250")
+def world_import_env():
+    """ World built from `to_dict` output (`override_env`). """
+    world_data = world.World(WORLD_SIZE, WORLD_SIZE, 42).to_dict()
+    yield lambda: world.World(world_data["height"], world_data["width"], world_data["seed"], override_env=world_data["env_data"])
+
+
+@benchmark("world/snapshot-encode-250", number=5)
+def world_snapshot_encode():
+    game_world = world.World(WORLD_SIZE, WORLD_SIZE, 42)
+    yield game_world.to_snapshot
+
+
+@benchmark("world/snapshot-decode-250")
+def world_snapshot_decode():
+    data = world.World(WORLD_SIZE, WORLD_SIZE, 42).to_snapshot()
+    yield lambda: world.World.from_snapshot(snapshot.decode(data))
+
+
+@benchmark("env/export-voxels")
+def env_export_voxels():
+    env_voxels = get_env_voxels(world.World(WORLD_SIZE, WORLD_SIZE, 42))
+    yield lambda: [environment.export_env_voxel(env_voxel) for env_voxel in env_voxels]
+
+
+@benchmark("env/import-voxels")
+def env_import_voxels():
+    exported = [environment.export_env_voxel(env_voxel) for env_voxel in get_env_voxels(world.World(WORLD_SIZE, WORLD_SIZE, 42))]
+    yield lambda: [environment.import_env_voxel(data) for data in exported]
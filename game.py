@@ -1,19 +1,32 @@
+from modules import textures
+from modules import protocol
+from modules import snapshot
+from modules import codec
 from modules import headers
 from modules import player
 from modules import world 
+from modules import interpolation
 
 from dataclasses import dataclass
 import socket
 import pygame
-import json
+import sys
 import os
 
 os.system("cls || clear")
 
+# Enemies are drawn INTERPOLATION_DELAY seconds in the past, smoothly between received states.
+INTERPOLATION_DELAY = interpolation.DEFAULT_INTERPOLATION_DELAY
+if len(sys.argv) > 1:
+    try:
+        INTERPOLATION_DELAY = float(sys.argv[1])
+    except ValueError:
+        print(f"ERROR: Invalid custom INTERPOLATION_DELAY: {sys.argv[1]} (using {INTERPOLATION_DELAY})")
+
 
 @dataclass
 class GameInitData:
-    world_data: dict | None = None
+    world_data: snapshot.WorldSnapshot | None = None
     player_data: dict | None = None
     
     def is_ready(self) -> bool:
@@ -30,16 +43,18 @@ class GameInitData:
 
 def receive_single() -> dict:
     """ Receive single message from server. """
-    data = client.recv(headers.CONN_BUFSIZE).decode().removesuffix(";")
-    message = json.loads(data)
-    if message:
-        return message
+    while True:
+        msg_type, payload = protocol.recv_frame(client, stream_decoder)
+        message = codec.decode_frame(msg_type, payload)
+        if message is not None:
+            return message
 
 
 ip_addr = input("IP: ")
 # ip_addr = "192.168.56.1"
 port = 5050
 client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+stream_decoder = protocol.FrameDecoder()
 
 try:
     client.connect((ip_addr, port))
@@ -58,6 +73,7 @@ print("Received world and player data.")
 pygame.init()
 screen = pygame.display.set_mode((700, 750), vsync=1)
 pygame.display.set_caption(f"Game [{game_init_data.player_data['color']}]")
+textures.preload()
 
-gen_world = world.World(game_init_data.world_data["height"], game_init_data.world_data["width"], game_init_data.world_data["seed"], game_init_data.world_data["env_data"])
-game_player = player.Player(screen, gen_world, client, game_init_data.player_data["color"], init_spawn=[game_init_data.player_data["spawn_y"], game_init_data.player_data["spawn_x"]])
+gen_world = world.World.from_snapshot(game_init_data.world_data)
+game_player = player.Player(screen, gen_world, client, game_init_data.player_data["color"], init_spawn=[game_init_data.player_data["spawn_y"], game_init_data.player_data["spawn_x"]], stream_decoder=stream_decoder, codec_name=codec.choose_codec(game_init_data.player_data.get("codecs")), server_bullets=game_init_data.player_data.get("server_bullets", False), interpolation_delay=INTERPOLATION_DELAY)
@@ -0,0 +1,144 @@
+from modules import environment
+from modules import codec
+
+import numpy as np
+
+BULLET_TICK = 0.1
+BULLET_MAX_MOVES = 25
+DEFAULT_CAPACITY = 64
+
+# Move per step of each direction id (angle // 45): N, NE, E, SE, S, SW, W, NW.
+DIRECTION_DX = np.array([0, 1, 1, 1, 0, -1, -1, -1], dtype=np.int32)
+DIRECTION_DY = np.array([-1, -1, 0, 1, 1, 1, 0, -1], dtype=np.int32)
+
+
+class BulletPool:
+    """
+    Bullets stored as struct of arrays, every bullet is a slot index.
+    Slots of removed bullets are reused, arrays grow when all slots are used.
+    Colors are stored as `codec.COLORS` ids.
+    """
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = 0
+        self.bullet_id = np.zeros(0, dtype=np.uint32)
+        self.color = np.zeros(0, dtype=np.uint8)
+        self.direction = np.zeros(0, dtype=np.uint8)
+        self.x = np.zeros(0, dtype=np.int32)
+        self.y = np.zeros(0, dtype=np.int32)
+        self.dx = np.zeros(0, dtype=np.int32)
+        self.dy = np.zeros(0, dtype=np.int32)
+        self.moved = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=np.bool_)
+        self._grow(capacity)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.alive))
+
+    def _grow(self, capacity: int) -> None:
+        for name in ["bullet_id", "color", "direction", "x", "y", "dx", "dy", "moved", "alive"]:
+            old_array = getattr(self, name)
+            new_array = np.zeros(capacity, dtype=old_array.dtype)
+            new_array[:self.capacity] = old_array
+            setattr(self, name, new_array)
+        self.capacity = capacity
+
+    def add(self, bullet_id: int, color: str, x: int, y: int, direction: int) -> int:
+        free_slots = np.flatnonzero(~self.alive)
+        if len(free_slots):
+            index = int(free_slots[0])
+        else:
+            index = self.capacity
+            self._grow(max(self.capacity * 2, 1))
+
+        direction_id = codec.encode_angle(direction) % len(DIRECTION_DX)
+        self.bullet_id[index] = bullet_id
+        self.color[index] = codec.COLOR_IDS[color]
+        self.direction[index] = direction_id
+        self.x[index] = x
+        self.y[index] = y
+        self.dx[index] = DIRECTION_DX[direction_id]
+        self.dy[index] = DIRECTION_DY[direction_id]
+        self.moved[index] = 0
+        self.alive[index] = True
+        return index
+
+    def kill(self, indices) -> None:
+        self.alive[indices] = False
+
+    def alive_indices(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+    def find(self, color: str, bullet_id: int) -> int | None:
+        found = np.flatnonzero(self.alive & (self.color == codec.COLOR_IDS[color]) & (self.bullet_id == bullet_id))
+        return int(found[0]) if len(found) else None
+
+    def step(self, world) -> np.ndarray:
+        """
+        Move all bullets by one tile. Bullets out of range, out of the map or
+        blocked by terrain are removed. Returns indices of bullets still flying.
+        """
+        indices = self.alive_indices()
+        self.x[indices] += self.dx[indices]
+        self.y[indices] += self.dy[indices]
+        self.moved[indices] += 1
+
+        xs, ys = self.x[indices], self.y[indices]
+        is_removed = (self.moved[indices] > BULLET_MAX_MOVES) | (xs < 0) | (xs >= world.width) | (ys < 0) | (ys >= world.height)
+        self.kill(indices[is_removed])
+        indices = indices[~is_removed]
+
+        is_blocked = world.ground.blocks_bullets_at(self.x[indices], self.y[indices])
+        self.kill(indices[is_blocked])
+        return indices[~is_blocked]
+
+    def hit_players(self, indices: np.ndarray, player_xs, player_ys, player_colors: list[str]) -> list[tuple[int, int]]:
+        """
+        Remove bullets standing on a player (other than the shooter).
+        Returns (bullet index, player index) pairs.
+        """
+        if not len(indices) or not len(player_colors):
+            return []
+
+        player_color_ids = np.array([codec.COLOR_IDS[color] for color in player_colors], dtype=np.uint8)
+        is_hit = (
+            (self.x[indices, None] == np.asarray(player_xs)[None, :])
+            & (self.y[indices, None] == np.asarray(player_ys)[None, :])
+            & (self.color[indices, None] != player_color_ids[None, :])
+        )
+        bullet_positions, player_indices = np.nonzero(is_hit)
+        # Bullet hits only one player.
+        bullet_positions, first = np.unique(bullet_positions, return_index=True)
+        hit_indices = indices[bullet_positions]
+        self.kill(hit_indices)
+        return list(zip(hit_indices.tolist(), player_indices[first].tolist()))
+
+    def hit_env(self, indices: np.ndarray, env_layer) -> list[tuple[int, int, int]]:
+        """
+        Apply `on_shot` of env voxels hit by bullets (replacing or removing voxels
+        and removing bullets when needed). Returns (bullet index, x, y) of every hit.
+        """
+        hits = []
+        for index, x, y in zip(indices.tolist(), self.x[indices].tolist(), self.y[indices].tolist()):
+            env_voxel = env_layer[y][x]
+            if not isinstance(env_voxel, environment.EnvVoxel):
+                continue
+
+            shot_feedback = env_voxel.on_shot()
+            if shot_feedback.remove_voxel:
+                env_layer[y][x] = None
+            elif shot_feedback.replace_voxel is not None:
+                env_layer[y][x] = shot_feedback.replace_voxel
+            if not shot_feedback.continue_fly:
+                self.alive[index] = False
+            hits.append((index, x, y))
+        return hits
+
+    def to_payloads(self, indices: np.ndarray) -> list[dict]:
+        """ Bullets as `headers.BULLETS_STATE` entries. """
+        return [
+            {"bullet_id": bullet_id, "color": codec.COLORS[color_id], "x": x, "y": y, "direction": codec.decode_angle(direction_id)}
+            for bullet_id, color_id, x, y, direction_id in zip(
+                self.bullet_id[indices].tolist(), self.color[indices].tolist(),
+                self.x[indices].tolist(), self.y[indices].tolist(), self.direction[indices].tolist()
+            )
+        ]
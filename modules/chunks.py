@@ -0,0 +1,151 @@
+from collections import OrderedDict
+import threading
+
+CHUNK_SIZE = 32
+MAX_LOADED_CHUNKS = 256
+
+
+class ChunkedRow:
+    """ Single row of `ChunkedLayer`, behaves like `list` for indexing and slicing. """
+    def __init__(self, layer: "ChunkedLayer", y: int) -> None:
+        self.layer = layer
+        self.y = y
+
+    def __len__(self) -> int:
+        return self.layer.width
+
+    def __iter__(self):
+        for x in range(self.layer.width):
+            yield self.layer.get(x, self.y)
+
+    def __getitem__(self, x):
+        if isinstance(x, slice):
+            return [self.layer.get(x_index, self.y) for x_index in range(*x.indices(self.layer.width))]
+        if x < 0:
+            x += self.layer.width
+        return self.layer.get(x, self.y)
+
+    def __setitem__(self, x: int, value) -> None:
+        if x < 0:
+            x += self.layer.width
+        self.layer.set(x, self.y, value)
+
+
+class ChunkedLayer:
+    """
+    `height` x `width` grid split into square chunks generated on first access by
+    `generate_chunk(top, left, rows, cols) -> list[list]`.
+    Keeps `layer[y][x]` access semantics of list of lists (also `layer[y, x]`),
+    `get` and `set` take `x, y` as in `EnvLayer` and `GroundLayer`.
+    Least recently used chunks are unloaded above `max_loaded_chunks`, unless modified
+    (modified chunks hold state which cannot be regenerated).
+    """
+    def __init__(self, height: int, width: int, generate_chunk, chunk_size: int = CHUNK_SIZE, max_loaded_chunks: int = MAX_LOADED_CHUNKS) -> None:
+        self.height = height
+        self.width = width
+        self.generate_chunk = generate_chunk
+        self.chunk_size = chunk_size
+        self.max_loaded_chunks = max_loaded_chunks
+        self._chunks: OrderedDict[tuple[int, int], list] = OrderedDict()
+        self._modified: set[tuple[int, int]] = set()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield ChunkedRow(self, y)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            y, x = key
+            return self.get(x, y)
+        if isinstance(key, slice):
+            return [ChunkedRow(self, y) for y in range(*key.indices(self.height))]
+        if key < 0:
+            key += self.height
+        if not 0 <= key < self.height:
+            raise IndexError("ChunkedLayer row index out of range")
+        return ChunkedRow(self, key)
+
+    def __setitem__(self, key: tuple[int, int], value) -> None:
+        y, x = key
+        self.set(x, y, value)
+
+    def get(self, x: int, y: int):
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            raise IndexError("ChunkedLayer index out of range")
+        chunk = self.get_chunk(y // self.chunk_size, x // self.chunk_size)
+        return chunk[y % self.chunk_size][x % self.chunk_size]
+
+    def set(self, x: int, y: int, value) -> None:
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            raise IndexError("ChunkedLayer index out of range")
+        chunk_key = (y // self.chunk_size, x // self.chunk_size)
+        with self._lock:
+            chunk = self.get_chunk(*chunk_key)
+            chunk[y % self.chunk_size][x % self.chunk_size] = value
+            self._modified.add(chunk_key)
+
+    def get_chunk(self, chunk_y: int, chunk_x: int) -> list:
+        chunk_key = (chunk_y, chunk_x)
+
+        with self._lock:
+            chunk = self._chunks.get(chunk_key)
+            if chunk is not None:
+                self._chunks.move_to_end(chunk_key)
+                return chunk
+
+            top = chunk_y * self.chunk_size
+            left = chunk_x * self.chunk_size
+            rows = min(self.chunk_size, self.height - top)
+            cols = min(self.chunk_size, self.width - left)
+            chunk = self.generate_chunk(top, left, rows, cols)
+
+            self._chunks[chunk_key] = chunk
+            self._unload_cold_chunks()
+            return chunk
+
+    def peek_chunk(self, chunk_y: int, chunk_x: int) -> list:
+        """ Chunk for reading only: not loaded chunk is generated but not kept (loaded chunks are not unloaded). """
+        with self._lock:
+            chunk = self._chunks.get((chunk_y, chunk_x))
+            if chunk is not None:
+                return chunk
+
+        top = chunk_y * self.chunk_size
+        left = chunk_x * self.chunk_size
+        return self.generate_chunk(top, left, min(self.chunk_size, self.height - top), min(self.chunk_size, self.width - left))
+
+    def column(self, x: int) -> list:
+        """ Values of column `x`, read chunk by chunk (see `peek_chunk`). """
+        if not 0 <= x < self.width:
+            raise IndexError("ChunkedLayer column index out of range")
+        chunk_x, local_x = divmod(x, self.chunk_size)
+        column = []
+        for chunk_y in range(self.chunks_shape()[0]):
+            column.extend(chunk_row[local_x] for chunk_row in self.peek_chunk(chunk_y, chunk_x))
+        return column
+
+    def chunks_shape(self) -> tuple[int, int]:
+        """ Amount of chunk rows and columns. """
+        return -(-self.height // self.chunk_size), -(-self.width // self.chunk_size)
+
+    def is_loaded(self, chunk_y: int, chunk_x: int) -> bool:
+        return (chunk_y, chunk_x) in self._chunks
+
+    def loaded_chunks_count(self) -> int:
+        return len(self._chunks)
+
+    def _unload_cold_chunks(self) -> None:
+        if len(self._chunks) <= self.max_loaded_chunks:
+            return
+
+        # Newest chunk is the one being accessed, never unload it.
+        for chunk_key in list(self._chunks.keys())[:-1]:
+            if len(self._chunks) <= self.max_loaded_chunks:
+                return
+            if chunk_key in self._modified:
+                continue
+            self._chunks.pop(chunk_key)
@@ -0,0 +1,228 @@
+from modules import environment
+from modules import directions
+from modules import protocol
+from modules import snapshot
+from modules import headers
+
+import struct
+
+CODEC_JSON = "json"
+CODEC_BINARY = "binary"
+SUPPORTED_CODECS = [CODEC_BINARY, CODEC_JSON]
+
+COLORS = ["red", "blue", "orange"]
+COLOR_IDS = {color: color_id for color_id, color in enumerate(COLORS)}
+BULLET_ID_LIMIT = 2 ** 32
+
+# Message id (first payload byte) of binary messages.
+MSG_PLAYER_UPDATE = 1
+MSG_ENEMY_UPDATE = 2
+MSG_RENDER_BULLET = 3
+MSG_WORLD_TICK = 4
+MSG_BULLETS_STATE = 5
+MSG_ENV_UPDATE = 6
+
+# message id, color, x, y, facing
+STATE_LAYOUT = struct.Struct("!BBHHB")
+# message id, color, bullet id, shot x, shot y, direction
+BULLET_LAYOUT = struct.Struct("!BBIHHB")
+# message id, enemies amount, bullets amount, followed by the entries below
+TICK_LAYOUT = struct.Struct("!BBH")
+# color, x, y, facing
+TICK_ENEMY_LAYOUT = struct.Struct("!BHHB")
+# color, bullet id, shot x, shot y, direction
+TICK_BULLET_LAYOUT = struct.Struct("!BIHHB")
+# message id, bullets amount, followed by bullets (TICK_BULLET_LAYOUT with current position)
+BULLETS_STATE_LAYOUT = struct.Struct("!BH")
+# message id, x, y, followed by env voxel (see `environment.pack_env_voxel`)
+ENV_UPDATE_LAYOUT = struct.Struct("!BHH")
+
+
+def encode_angle(angle: directions.AngleDirection) -> int:
+    return angle // 45
+
+
+def decode_angle(angle_id: int) -> directions.AngleDirection:
+    return angle_id * 45
+
+
+def _encode_state(msg_id: int, payload: dict) -> bytes:
+    return STATE_LAYOUT.pack(msg_id, COLOR_IDS[payload["color"]], payload["x"], payload["y"], encode_angle(payload["facing"]))
+
+
+def _decode_state(data: memoryview) -> dict:
+    _, color_id, x, y, facing = STATE_LAYOUT.unpack_from(data)
+    return {"color": COLORS[color_id], "x": x, "y": y, "facing": decode_angle(facing)}
+
+
+def _encode_bullet(msg_id: int, payload: dict) -> bytes:
+    return BULLET_LAYOUT.pack(
+        msg_id, COLOR_IDS[payload["color"]], payload["bullet_id"],
+        payload["shot_x"], payload["shot_y"], encode_angle(payload["direction"])
+    )
+
+
+def _decode_bullet(data: memoryview) -> dict:
+    _, color_id, bullet_id, shot_x, shot_y, direction = BULLET_LAYOUT.unpack_from(data)
+    return {
+        "bullet_id": bullet_id, "color": COLORS[color_id],
+        "shot_x": shot_x, "shot_y": shot_y, "direction": decode_angle(direction)
+    }
+
+
+def _encode_tick(msg_id: int, payload: dict) -> bytes:
+    enemies, bullets = payload["enemies"], payload["bullets"]
+    data = [TICK_LAYOUT.pack(msg_id, len(enemies), len(bullets))]
+    for enemy in enemies:
+        data.append(TICK_ENEMY_LAYOUT.pack(COLOR_IDS[enemy["color"]], enemy["x"], enemy["y"], encode_angle(enemy["facing"])))
+    for bullet in bullets:
+        data.append(TICK_BULLET_LAYOUT.pack(
+            COLOR_IDS[bullet["color"]], bullet["bullet_id"],
+            bullet["shot_x"], bullet["shot_y"], encode_angle(bullet["direction"])
+        ))
+    return b"".join(data)
+
+
+def _decode_tick(data: memoryview) -> dict:
+    _, enemies_count, bullets_count = TICK_LAYOUT.unpack_from(data)
+    offset = TICK_LAYOUT.size
+
+    enemies = []
+    for color_id, x, y, facing in TICK_ENEMY_LAYOUT.iter_unpack(data[offset:offset + enemies_count * TICK_ENEMY_LAYOUT.size]):
+        enemies.append({"color": COLORS[color_id], "x": x, "y": y, "facing": decode_angle(facing)})
+    offset += enemies_count * TICK_ENEMY_LAYOUT.size
+
+    bullets = []
+    for color_id, bullet_id, shot_x, shot_y, direction in TICK_BULLET_LAYOUT.iter_unpack(data[offset:offset + bullets_count * TICK_BULLET_LAYOUT.size]):
+        bullets.append({
+            "bullet_id": bullet_id, "color": COLORS[color_id],
+            "shot_x": shot_x, "shot_y": shot_y, "direction": decode_angle(direction)
+        })
+    return {"enemies": enemies, "bullets": bullets}
+
+
+def _encode_bullets_state(msg_id: int, payload: dict) -> bytes:
+    bullets = payload["bullets"]
+    data = [BULLETS_STATE_LAYOUT.pack(msg_id, len(bullets))]
+    for bullet in bullets:
+        data.append(TICK_BULLET_LAYOUT.pack(
+            COLOR_IDS[bullet["color"]], bullet["bullet_id"],
+            bullet["x"], bullet["y"], encode_angle(bullet["direction"])
+        ))
+    return b"".join(data)
+
+
+def _decode_bullets_state(data: memoryview) -> dict:
+    _, bullets_count = BULLETS_STATE_LAYOUT.unpack_from(data)
+    offset = BULLETS_STATE_LAYOUT.size
+
+    bullets = []
+    for color_id, bullet_id, x, y, direction in TICK_BULLET_LAYOUT.iter_unpack(data[offset:offset + bullets_count * TICK_BULLET_LAYOUT.size]):
+        bullets.append({
+            "bullet_id": bullet_id, "color": COLORS[color_id],
+            "x": x, "y": y, "direction": decode_angle(direction)
+        })
+    return {"bullets": bullets}
+
+
+def _encode_env_update(msg_id: int, payload: dict) -> bytes:
+    return ENV_UPDATE_LAYOUT.pack(msg_id, payload["x"], payload["y"]) + environment.pack_env_data(payload["voxel"])
+
+
+def _decode_env_update(data: memoryview) -> dict:
+    _, x, y = ENV_UPDATE_LAYOUT.unpack_from(data)
+    try:
+        voxel = environment.unpack_env_data(data, ENV_UPDATE_LAYOUT.size)
+    except (KeyError, IndexError):
+        raise struct.error("Invalid env voxel")
+    return {"x": x, "y": y, "voxel": voxel}
+
+
+# header: (message id, encoder)
+binary_encoders = {
+    headers.PLAYER_UPDATE: (MSG_PLAYER_UPDATE, _encode_state),
+    headers.ENEMY_UPDATE: (MSG_ENEMY_UPDATE, _encode_state),
+    headers.RENDER_BULLET: (MSG_RENDER_BULLET, _encode_bullet),
+    headers.WORLD_TICK: (MSG_WORLD_TICK, _encode_tick),
+    headers.BULLETS_STATE: (MSG_BULLETS_STATE, _encode_bullets_state),
+    headers.ENV_UPDATE: (MSG_ENV_UPDATE, _encode_env_update),
+}
+# message id: (header, decoder)
+binary_decoders = {
+    MSG_PLAYER_UPDATE: (headers.PLAYER_UPDATE, _decode_state),
+    MSG_ENEMY_UPDATE: (headers.ENEMY_UPDATE, _decode_state),
+    MSG_RENDER_BULLET: (headers.RENDER_BULLET, _decode_bullet),
+    MSG_WORLD_TICK: (headers.WORLD_TICK, _decode_tick),
+    MSG_BULLETS_STATE: (headers.BULLETS_STATE, _decode_bullets_state),
+    MSG_ENV_UPDATE: (headers.ENV_UPDATE, _decode_env_update),
+}
+
+
+def choose_codec(remote_codecs: list[str] | None) -> str:
+    """ First of our codecs supported by remote side (JSON if remote did not tell). """
+    for codec_name in SUPPORTED_CODECS:
+        if remote_codecs and codec_name in remote_codecs:
+            return codec_name
+    return CODEC_JSON
+
+
+def encode_frame(header: str, payload: dict = {}, codec_name: str = CODEC_JSON) -> bytes:
+    """ Frame with binary message if possible for given codec, JSON message otherwise. """
+    if codec_name == CODEC_BINARY and header in binary_encoders:
+        msg_id, encoder = binary_encoders[header]
+        try:
+            return protocol.encode_frame(protocol.MSG_BINARY, encoder(msg_id, payload))
+        except (KeyError, struct.error):
+            pass
+    return protocol.encode_json(header, payload)
+
+
+def decode_frame(msg_type: int, payload: memoryview) -> dict | None:
+    """ Message (`{"EVENT": ..., "PAYLOAD": ...}`) from frame of any codec. """
+    if msg_type == protocol.MSG_JSON:
+        try:
+            message = protocol.decode_json(payload)
+        except ValueError as error:
+            print(f"ERROR: Received invalid JSON message: {error}")
+            return None
+        if not isinstance(message, dict) or not isinstance(message.get("EVENT"), str):
+            print("ERROR: Received JSON message without event")
+            return None
+        return message
+
+    if msg_type == protocol.MSG_BINARY and len(payload):
+        header, decoder = binary_decoders.get(payload[0], (None, None))
+        if decoder is not None:
+            try:
+                return {"EVENT": header, "PAYLOAD": decoder(payload)}
+            except struct.error as error:
+                print(f"ERROR: Received invalid binary message: {error}")
+                return None
+
+    if msg_type == protocol.MSG_WORLD_SNAPSHOT:
+        try:
+            return {"EVENT": headers.GAME_INIT_WORLD_DATA, "PAYLOAD": snapshot.decode(payload)}
+        except snapshot.SnapshotError as error:
+            print(f"ERROR: Received invalid world snapshot: {error}")
+            return None
+
+    print(f"ERROR: Received unknown message type: {msg_type}")
+    return None
+
+
+class EncodedMessage:
+    """ Message encoded at most once per codec, used when sending to many clients. """
+    def __init__(self, header: str, payload: dict = {}) -> None:
+        self.header = header
+        self.payload = payload
+        self._frames: dict[str, bytes] = {}
+
+    def is_encoded(self, codec_name: str) -> bool:
+        return codec_name in self._frames
+
+    def get_frame(self, codec_name: str) -> bytes:
+        frame = self._frames.get(codec_name)
+        if frame is None:
+            frame = encode_frame(self.header, self.payload, codec_name)
+            self._frames[codec_name] = frame
+        return frame
@@ -1,3 +1,4 @@
+from modules import textures
 from modules import voxels
 
 from abc import abstractmethod
@@ -27,7 +28,7 @@ class C_AmmunitionBox(Collectable):
         super().__init__("ammo_box", [voxels.grass, voxels.sand, voxels.shallow_water, voxels.deep_water], 0.003)
 
     def get_texture(self) -> pygame.Surface | None:
-        return pygame.image.load("./textures/collectables/ammobox.png").convert_alpha()
+        return textures.get("./textures/collectables/ammobox.png")
 
     def collect(self, player) -> None:
         additional_ammo = random.randint(5, 20)
@@ -39,7 +40,7 @@ class C_HealthBox(Collectable):
         super().__init__("health_box", [voxels.grass, voxels.sand, voxels.shallow_water, voxels.deep_water], 0.001)
 
     def get_texture(self) -> pygame.Surface | None:
-        return pygame.image.load("./textures/collectables/healthbox.png").convert_alpha()
+        return textures.get("./textures/collectables/healthbox.png")
 
     def collect(self, player) -> None:
         additional_health = random.randint(30, 60)
@@ -53,7 +54,7 @@ class C_VisibilityBoost(Collectable):
         super().__init__("vis_boost", [voxels.grass, voxels.sand, voxels.shallow_water, voxels.deep_water], 0.0003)
 
     def get_texture(self) -> pygame.Surface | None:
-        return pygame.image.load("./textures/collectables/vis_boost.png").convert_alpha()
+        return textures.get("./textures/collectables/vis_boost.png")
 
     def collect(self, player) -> None:
         player.update_visibility(player.visibility + 1)
@@ -64,7 +65,7 @@ class C_SpeedBoost(Collectable):
         super().__init__("speed_boost", [voxels.grass, voxels.sand, voxels.shallow_water, voxels.deep_water], 0.0003)
 
     def get_texture(self) -> pygame.Surface | None:
-        return pygame.image.load("./textures/collectables/speed_boost.png").convert_alpha()
+        return textures.get("./textures/collectables/speed_boost.png")
 
     def collect(self, player) -> None:
         player.speedness += random.randrange(5, 15) / 100
@@ -78,7 +79,7 @@ class C_AdditionalBox(Collectable):
         super().__init__("add_box", [voxels.grass, voxels.sand, voxels.shallow_water, voxels.deep_water], 0.005)
 
     def get_texture(self) -> pygame.Surface | None:
-        return pygame.image.load("./textures/collectables/add_box.png").convert_alpha()
+        return textures.get("./textures/collectables/add_box.png")
 
     def collect(self, player) -> None:
         if player.walls_available < 10:
@@ -24,6 +24,7 @@ NORTHISH = {AngleDirection.N, AngleDirection.NE, AngleDirection.NW}
 SOUTHISH = {AngleDirection.S, AngleDirection.SE, AngleDirection.SW}
 EASTISH = {AngleDirection.E, AngleDirection.NE, AngleDirection.SE}
 WESTISH = {AngleDirection.W, AngleDirection.NW, AngleDirection.SW}
+ALL_ANGLES = NORTHISH | SOUTHISH | EASTISH | WESTISH
     
 
 def calc_direction_angle_range(mid_angle: int) -> range:
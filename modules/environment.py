@@ -1,10 +1,16 @@
+from modules import collectables
+from modules import textures
 from modules import helpers
 from modules import voxels
+from modules import perlin
 
 from dataclasses import dataclass
 from abc import abstractmethod
+import numpy as np
+import operator
 import pygame
 import random
+import struct
 
 
 @dataclass
@@ -12,9 +18,14 @@ class BulletHitInfo:
     continue_fly: bool
     remove_voxel: bool
     texture_affected: bool
+    # Env voxel put in place of the shot one (env voxels are shared, never changed in place).
+    replace_voxel: "EnvVoxel | None" = None
 
 
 class EnvVoxel:
+    # Ordered (attribute, struct format) pairs of per-voxel state sent over the wire.
+    FIELDS: tuple[tuple[str, str], ...] = ()
+    
     def __init__(self, name: str, can_spawn_on: list[voxels.GroundVoxel], can_player_stand_on: bool):
         self.name = name
         self.can_stand_on = can_spawn_on
@@ -32,31 +43,27 @@ class EnvVoxel:
         
         
 class Tree(EnvVoxel):
-    def __init__(self):
+    FIELDS = (("health", "B"),)
+    # Inclusive range of the field of generated voxels.
+    GENERATED_RANGE = (2, 3)
+    
+    def __init__(self, health: int | None = None):
         super().__init__("tree", [voxels.grass], False)
-        self.health = random.randint(2, 3)
-        self._txt_dir = "./textures/env/tree/"
+        self.health = random.randint(*self.GENERATED_RANGE) if health is None else health
+        self.can_player_stand_on = self.health == 1
         
     def get_texture(self) -> pygame.Surface | None:
-        path = self._txt_dir
-        
         if self.health == 3:
-            path += "tree-1.png"
+            return textures.get("./textures/env/tree/tree-1.png")
         if self.health == 2:
-            path += "tree-2.png"
+            return textures.get("./textures/env/tree/tree-2.png")
         if self.health == 1:
-            path += "tree-3.png"
-        if self.health < 1:
-            return None
-            
-        return pygame.image.load(path).convert_alpha()
+            return textures.get("./textures/env/tree/tree-3.png")
+        return None
         
     def on_shot(self) -> BulletHitInfo:
         if self.health > 1:
-            self.health -= 1
-            if self.health == 1:
-                self.can_player_stand_on = True
-            return BulletHitInfo(False, False, True)
+            return BulletHitInfo(False, False, True, Tree(self.health - 1))
         else:
             return BulletHitInfo(False, True, True)
     
@@ -66,33 +73,37 @@ class Bush(EnvVoxel):
         super().__init__("bush", [voxels.grass], True)
         
     def get_texture(self) -> pygame.Surface | None:
-        return pygame.image.load("./textures/env/bush.png").convert_alpha()
+        return textures.get("./textures/env/bush.png")
     
     
 class Box(EnvVoxel):
-    def __init__(self):
+    FIELDS = (("health", "B"),)
+    
+    def __init__(self, health: int = 5):
         super().__init__("box", [], False)
-        self.health = 5
+        self.health = health
         
     def get_texture(self) -> pygame.Surface | None:
-        return pygame.image.load(f"./textures/box/box{self.health}.png").convert_alpha()
+        return textures.get(f"./textures/box/box{self.health}.png")
     
     def on_shot(self) -> BulletHitInfo:
         if self.health == 1:
             return BulletHitInfo(False, True, True)
             
         if self.health > 1:
-            self.health -= 1
-            return BulletHitInfo(False, False, True)
+            return BulletHitInfo(False, False, True, Box(self.health - 1))
 
 
 class Cactus(EnvVoxel):
-    def __init__(self):
+    FIELDS = (("variant", "B"),)
+    GENERATED_RANGE = (1, 9)
+    
+    def __init__(self, variant: int | None = None):
         super().__init__("cactus", [voxels.sand], False)
-        self.texture_path = f"./textures/env/cactus/cactus{random.randint(1,9)}.png"
+        self.variant = random.randint(*self.GENERATED_RANGE) if variant is None else variant
         
     def get_texture(self) -> pygame.Surface | None:
-        return pygame.image.load(self.texture_path).convert_alpha()
+        return textures.get(f"./textures/env/cactus/cactus{self.variant}.png")
     
     def on_shot(self) -> BulletHitInfo:
         return BulletHitInfo(False, True, False)
@@ -105,44 +116,249 @@ generation_map = {
 }
 
 
-def env_voxel_from_perlin(value: float) -> EnvVoxel | None:
+def _classify(value: float) -> type | None:
     for gen_range, env_voxel in generation_map.items():
         if value in gen_range:
-            return env_voxel()
+            return env_voxel
+
+
+# Env voxel type generated for every normalized perlin value (see `perlin.lut_index`).
+ENV_GENERATION_LUT = [_classify(value) for value in perlin.lut_values()]
+
+
+def env_voxel_from_perlin(value: float) -> EnvVoxel | None:
+    env_voxel = ENV_GENERATION_LUT[int(perlin.lut_index(value))]
+    return env_voxel() if env_voxel is not None else None
+
+
+# Env type id is index in this list, 0 is an empty cell.
+ENV_TYPES: list[str | None] = [
+    None, "tree", "bush", "cactus", "box",
+    "ammo_box", "health_box", "vis_boost", "speed_boost", "add_box",
+]
+ENV_TYPE_IDS = {name: type_id for type_id, name in enumerate(ENV_TYPES)}
+env_voxel_types = {
+    "tree": Tree,
+    "bush": Bush,
+    "cactus": Cactus,
+    "box": Box,
+}
+ENV_VOXEL_NAMES = {voxel_type: name for name, voxel_type in env_voxel_types.items()}
 
-    return None
+
+# Shared instances kept per env kind (covers all uint8 states).
+MAX_FLYWEIGHTS = 256
+
+
+class EnvVoxelCodec:
+    """
+    Encoder / decoder of single env kind, compiled from its `FIELDS` schema
+    (ordered `(attribute, struct format)` pairs). Binary form is type id
+    followed by the fields. Env voxels are flyweights: one shared instance
+    per kind and fields values (collectables use their global `instance`).
+    """
+    def __init__(self, name: str, voxel_type: type | None = None, instance=None) -> None:
+        self.name = name
+        self.type_id = ENV_TYPE_IDS[name]
+        self.voxel_type = voxel_type
+        self.instance = instance
+        self.fields = tuple(field_name for field_name, _ in getattr(voxel_type, "FIELDS", ()))
+        self.layout = struct.Struct("!B" + "".join(field_format for _, field_format in getattr(voxel_type, "FIELDS", ())))
+        self._get_fields = operator.attrgetter(*self.fields) if len(self.fields) > 1 else None
+        self._instances: dict[tuple, EnvVoxel] = {}
+
+    def get_values(self, env_voxel) -> tuple:
+        if self._get_fields is not None:
+            return self._get_fields(env_voxel)
+        if self.fields:
+            return (getattr(env_voxel, self.fields[0]),)
+        return ()
+
+    def create(self, values):
+        if self.instance is not None:
+            return self.instance
+
+        values = tuple(values)
+        env_voxel = self._instances.get(values)
+        if env_voxel is None:
+            env_voxel = self.voxel_type(*values)
+            if len(self._instances) < MAX_FLYWEIGHTS:
+                self._instances[values] = env_voxel
+        return env_voxel
+
+    def to_json(self, env_voxel) -> dict:
+        data = {"name": self.name}
+        data.update(zip(self.fields, self.get_values(env_voxel)))
+        return data
+
+    def from_json(self, data: dict):
+        return self.create([data[field_name] for field_name in self.fields])
+
+    def pack(self, env_voxel) -> bytes:
+        return self.layout.pack(self.type_id, *self.get_values(env_voxel))
+
+    def unpack(self, data, offset: int = 0):
+        return self.create(self.layout.unpack_from(data, offset)[1:])
+
+    def pack_json(self, data: dict) -> bytes:
+        return self.layout.pack(self.type_id, *[data[field_name] for field_name in self.fields])
+
+    def unpack_json(self, data, offset: int = 0) -> dict:
+        json_data = {"name": self.name}
+        json_data.update(zip(self.fields, self.layout.unpack_from(data, offset)[1:]))
+        return json_data
+
+
+env_codecs: dict[str, EnvVoxelCodec] = {}
+for _name, _voxel_type in env_voxel_types.items():
+    env_codecs[_name] = EnvVoxelCodec(_name, _voxel_type)
+for _collectable in collectables.all_collectables:
+    env_codecs[_collectable.name] = EnvVoxelCodec(_collectable.name, type(_collectable), _collectable)
+env_codecs_by_id = {env_codec.type_id: env_codec for env_codec in env_codecs.values()}
 
 
 def export_env_voxel(env_voxel: EnvVoxel | None) -> dict:
     if env_voxel is None:
         return {"name": None}
-    export_data = {"name": env_voxel.name}
-    
-    for attr_name in dir(env_voxel):
-        if attr_name.startswith("__"):
-            continue
-        value = getattr(env_voxel, attr_name)
-        if not hasattr(value, "__call__") and attr_name not in ["can_stand_on", "can_player_stand_on"]:
-            export_data[attr_name] = value
-        
-    return export_data
+    return env_codecs[env_voxel.name].to_json(env_voxel)
+
 
 def import_env_voxel(data: dict) -> EnvVoxel | None:
     if data["name"] is None:
         return None
-    
-    objects_translation = {
-        "tree": Tree,
-        "cactus": Cactus,
-        "bush": Bush,
-        "box": Box,
-    }
-    
-    name = data.pop("name")
-    env_obj = objects_translation[name]()
-    for attr_name, attr_value in data.items():
-        setattr(env_obj, attr_name, attr_value)    
-    return env_obj
-    
-    
-    
\ No newline at end of file
+    return env_codecs[data["name"]].from_json(data)
+
+
+def pack_env_voxel(env_voxel: EnvVoxel | None) -> bytes:
+    if env_voxel is None:
+        return bytes([0])
+    return env_codecs[env_voxel.name].pack(env_voxel)
+
+
+def unpack_env_voxel(data, offset: int = 0) -> EnvVoxel | None:
+    type_id = data[offset]
+    if type_id == 0:
+        return None
+    return env_codecs_by_id[type_id].unpack(data, offset)
+
+
+def pack_env_data(data: dict) -> bytes:
+    """ Binary form of `export_env_voxel` result. """
+    if data["name"] is None:
+        return bytes([0])
+    return env_codecs[data["name"]].pack_json(data)
+
+
+def unpack_env_data(data, offset: int = 0) -> dict:
+    """ `export_env_voxel` result from its binary form. """
+    type_id = data[offset]
+    if type_id == 0:
+        return {"name": None}
+    return env_codecs_by_id[type_id].unpack_json(data, offset)
+
+
+# Env voxel of every (type id, state) pair of `EnvLayer`, stateful kinds have a single uint8 field.
+ENV_VOXEL_TABLE = np.full((len(ENV_TYPES), 256), None, dtype=object)
+for _env_codec in env_codecs.values():
+    if _env_codec.fields:
+        for _state in range(256):
+            ENV_VOXEL_TABLE[_env_codec.type_id, _state] = _env_codec.create((_state,))
+    else:
+        ENV_VOXEL_TABLE[_env_codec.type_id, :] = _env_codec.create(())
+
+# Env type id generated for every normalized perlin value, 0 where nothing is generated.
+ENV_TYPE_LUT = np.array(
+    [0 if env_voxel is None else ENV_TYPE_IDS[ENV_VOXEL_NAMES[env_voxel]] for env_voxel in ENV_GENERATION_LUT],
+    dtype=np.uint8
+)
+# Ground voxel ids each env kind (and collectable) can be generated on.
+ENV_SPAWN_MASK = np.zeros((len(ENV_TYPES), len(voxels.voxel_registry)), dtype=np.bool_)
+for _env_codec in env_codecs.values():
+    _env_voxel = ENV_VOXEL_TABLE[_env_codec.type_id, 1]
+    _spawn_on = _env_voxel.spawn_on if isinstance(_env_voxel, collectables.Collectable) else _env_voxel.can_stand_on
+    ENV_SPAWN_MASK[_env_codec.type_id, [voxels.voxel_ids[voxel] for voxel in _spawn_on]] = True
+
+
+
+class EnvRow:
+    """ Row of `EnvLayer`, indexing returns env voxels (or None). """
+    def __init__(self, layer: "EnvLayer", y: int) -> None:
+        self.layer = layer
+        self.y = y
+
+    def __len__(self) -> int:
+        return self.layer.width
+
+    def __iter__(self):
+        return iter(self.layer.row(self.y))
+
+    def __getitem__(self, x):
+        if isinstance(x, slice):
+            return ENV_VOXEL_TABLE[self.layer.types[self.y, x], self.layer.states[self.y, x]].tolist()
+        return self.layer.get(x, self.y)
+
+    def __setitem__(self, x: int, env_voxel: EnvVoxel | None) -> None:
+        self.layer.set(x, self.y, env_voxel)
+
+
+class EnvLayer:
+    """
+    Env layer stored as uint8 type ids (see `ENV_TYPES`) and uint8 states of
+    stateful kinds (their single schema field, e.g. tree health), no object per cell.
+    `layer[y][x]` still returns env voxel, shared by all cells of the same kind and state.
+    """
+    def __init__(self, height: int, width: int, types: np.ndarray | None = None, states: np.ndarray | None = None) -> None:
+        self.height = height
+        self.width = width
+        self.types = np.zeros((height, width), dtype=np.uint8) if types is None else types
+        self.states = np.zeros((height, width), dtype=np.uint8) if states is None else states
+
+    @classmethod
+    def from_rows(cls, rows) -> "EnvLayer":
+        """ Layer from list of lists of env voxels. """
+        height = len(rows)
+        env_layer = cls(height, len(rows[0]) if height else 0)
+        for y, row in enumerate(rows):
+            for x, env_voxel in enumerate(row):
+                if env_voxel is not None:
+                    env_layer.set(x, y, env_voxel)
+        return env_layer
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield EnvRow(self, y)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            y, x = key
+            return self.get(x, y)
+        if isinstance(key, slice):
+            return [EnvRow(self, y) for y in range(*key.indices(self.height))]
+        if key < 0:
+            key += self.height
+        if not 0 <= key < self.height:
+            raise IndexError("EnvLayer row index out of range")
+        return EnvRow(self, key)
+
+    def __setitem__(self, key: tuple[int, int], env_voxel: EnvVoxel | None) -> None:
+        y, x = key
+        self.set(x, y, env_voxel)
+
+    def row(self, y: int) -> list:
+        return ENV_VOXEL_TABLE[self.types[y], self.states[y]].tolist()
+
+    def get(self, x: int, y: int) -> EnvVoxel | None:
+        return ENV_VOXEL_TABLE[self.types[y, x], self.states[y, x]]
+
+    def set(self, x: int, y: int, env_voxel: EnvVoxel | None) -> None:
+        if env_voxel is None:
+            self.types[y, x] = 0
+            self.states[y, x] = 0
+            return
+
+        env_codec = env_codecs[env_voxel.name]
+        self.types[y, x] = env_codec.type_id
+        self.states[y, x] = env_codec.get_values(env_voxel)[0] if env_codec.fields else 0
@@ -0,0 +1,186 @@
+from modules import voxels
+
+from collections import OrderedDict
+import numpy as np
+import threading
+import pygame
+
+TILE_SIZE = 64
+CHUNK_TILES = 8
+MAX_BAKED_CHUNKS = 48
+NO_VOXEL = 255
+
+# Corner bits, each corner is drawn with texture of neighbour voxel given below.
+CORNER_NW = 1  # west == north, west corner texture
+CORNER_NE = 2  # north == east, north corner texture
+CORNER_SE = 4  # east == south, east corner texture
+CORNER_SW = 8  # south == west, south corner texture
+CORNER_ROTATIONS = {CORNER_NW: 0, CORNER_NE: 270, CORNER_SE: 180, CORNER_SW: 90}
+
+VOXEL_HAS_CORNER = np.array([voxel.corner_texture is not None for voxel in voxels.voxel_registry] + [False] * (256 - len(voxels.voxel_registry)), dtype=np.bool_)
+
+
+def compute_corner_mask(padded_ids: np.ndarray) -> np.ndarray:
+    """
+    Corner bits for every cell of `padded_ids` without its 1 cell border,
+    neighbour comparison is done on whole grid at once. Border cells outside
+    of the map should be `NO_VOXEL`.
+    """
+    center = (slice(1, -1), slice(1, -1))
+    north = padded_ids[:-2, 1:-1]
+    south = padded_ids[2:, 1:-1]
+    west = padded_ids[1:-1, :-2]
+    east = padded_ids[1:-1, 2:]
+
+    mask = np.zeros(padded_ids[center].shape, dtype=np.uint8)
+    for bit, side_a, side_b in [
+        (CORNER_NW, west, north),
+        (CORNER_NE, north, east),
+        (CORNER_SE, east, south),
+        (CORNER_SW, south, west),
+    ]:
+        has_corner = (side_a == side_b) & (side_a != NO_VOXEL) & VOXEL_HAS_CORNER[side_a]
+        mask |= np.where(has_corner, bit, 0).astype(np.uint8)
+    return mask
+
+
+class GroundCache:
+    """
+    Pre-rendered ground (textures with corner overlays) in chunks of
+    `CHUNK_TILES` x `CHUNK_TILES` tiles. Camera composes visible part with
+    a few blits, chunks are baked on first use and rebuilt only after `invalidate`.
+    """
+    def __init__(self, world, chunk_tiles: int = CHUNK_TILES, max_baked_chunks: int = MAX_BAKED_CHUNKS) -> None:
+        self.world = world
+        self.chunk_tiles = chunk_tiles
+        self.max_baked_chunks = max_baked_chunks
+        self._chunks: OrderedDict[tuple[int, int], pygame.Surface] = OrderedDict()
+        self._corner_textures: dict[tuple[int, int], pygame.Surface] = {}
+        self._lock = threading.RLock()
+
+        self.corner_mask = None
+        if isinstance(self.world.ground.ids, np.ndarray):
+            self.corner_mask = compute_corner_mask(self._padded_ids(0, 0, self.world.height, self.world.width))
+
+    def _padded_ids(self, top: int, left: int, rows: int, cols: int) -> np.ndarray:
+        """ Ids of region with 1 cell border, cells outside of the map are `NO_VOXEL`. """
+        padded = np.full((rows + 2, cols + 2), NO_VOXEL, dtype=np.uint8)
+        src_top, src_bottom = max(top - 1, 0), min(top + rows + 1, self.world.height)
+        src_left, src_right = max(left - 1, 0), min(left + cols + 1, self.world.width)
+
+        ground_ids = self.world.ground.ids
+        for y in range(src_top, src_bottom):
+            padded[y - top + 1, src_left - left + 1:src_right - left + 1] = ground_ids[y][src_left:src_right]
+        return padded
+
+    def _region_texture_variants(self, top: int, left: int, rows: int, cols: int) -> np.ndarray:
+        texture_variants = self.world.texture_variants
+        if isinstance(texture_variants, np.ndarray):
+            return texture_variants[top:top+rows, left:left+cols]
+        return np.array([texture_variants[y][left:left+cols] for y in range(top, top+rows)], dtype=np.uint8)
+
+    def _region_corner_mask(self, top: int, left: int, rows: int, cols: int) -> np.ndarray:
+        if self.corner_mask is not None:
+            return self.corner_mask[top:top+rows, left:left+cols]
+        return compute_corner_mask(self._padded_ids(top, left, rows, cols))
+
+    def _get_corner_texture(self, voxel_id: int, bit: int) -> pygame.Surface:
+        key = (voxel_id, bit)
+        texture = self._corner_textures.get(key)
+        if texture is None:
+            texture = voxels.voxel_registry[voxel_id].corner_texture.convert_alpha()
+            if CORNER_ROTATIONS[bit]:
+                texture = pygame.transform.rotate(texture, CORNER_ROTATIONS[bit])
+            self._corner_textures[key] = texture
+        return texture
+
+    def _bake_chunk(self, chunk_y: int, chunk_x: int) -> pygame.Surface:
+        top = chunk_y * self.chunk_tiles
+        left = chunk_x * self.chunk_tiles
+        rows = min(self.chunk_tiles, self.world.height - top)
+        cols = min(self.chunk_tiles, self.world.width - left)
+
+        padded_ids = self._padded_ids(top, left, rows, cols)
+        corner_mask = self._region_corner_mask(top, left, rows, cols)
+        texture_variants = self._region_texture_variants(top, left, rows, cols).tolist()
+        surface = pygame.Surface((cols * TILE_SIZE, rows * TILE_SIZE)).convert()
+
+        for y in range(rows):
+            for x in range(cols):
+                voxel_id = int(padded_ids[y+1, x+1])
+                texture = voxels.voxel_registry[voxel_id].get_texture(texture_variants[y][x])
+                position = (x * TILE_SIZE, y * TILE_SIZE)
+                surface.blit(texture, position)
+
+                corners = int(corner_mask[y, x])
+                if not corners:
+                    continue
+
+                neighbours = {
+                    CORNER_NW: padded_ids[y+1, x],
+                    CORNER_NE: padded_ids[y, x+1],
+                    CORNER_SE: padded_ids[y+1, x+2],
+                    CORNER_SW: padded_ids[y+2, x+1],
+                }
+                for bit, neighbour_id in neighbours.items():
+                    if corners & bit:
+                        surface.blit(self._get_corner_texture(int(neighbour_id), bit), position)
+
+        return surface
+
+    def get_chunk(self, chunk_y: int, chunk_x: int) -> pygame.Surface:
+        chunk_key = (chunk_y, chunk_x)
+
+        with self._lock:
+            surface = self._chunks.get(chunk_key)
+            if surface is not None:
+                self._chunks.move_to_end(chunk_key)
+                return surface
+
+            surface = self._bake_chunk(chunk_y, chunk_x)
+            self._chunks[chunk_key] = surface
+            while len(self._chunks) > self.max_baked_chunks:
+                self._chunks.popitem(last=False)
+            return surface
+
+    def invalidate(self, x: int, y: int) -> None:
+        """ Call after ground at `x`, `y` changed, rebuilds affected corners and chunks. """
+        with self._lock:
+            if self.corner_mask is not None:
+                top, left = max(y - 1, 0), max(x - 1, 0)
+                bottom, right = min(y + 2, self.world.height), min(x + 2, self.world.width)
+                self.corner_mask[top:bottom, left:right] = compute_corner_mask(
+                    self._padded_ids(top, left, bottom - top, right - left)
+                )
+
+            for near_y in (y - 1, y, y + 1):
+                for near_x in (x - 1, x, x + 1):
+                    self._chunks.pop((near_y // self.chunk_tiles, near_x // self.chunk_tiles), None)
+
+    def blit(self, screen: pygame.Surface, top: int, left: int, bottom: int, right: int, origin_x: int, origin_y: int) -> None:
+        """
+        Draw ground tiles of rows `top`..`bottom` and columns `left`..`right` (inclusive,
+        clipped to the map). `origin_x`, `origin_y` is screen position of map's (0, 0) tile.
+        """
+        top, left = max(top, 0), max(left, 0)
+        bottom, right = min(bottom, self.world.height - 1), min(right, self.world.width - 1)
+        if top > bottom or left > right:
+            return
+
+        chunk_size = self.chunk_tiles * TILE_SIZE
+        for chunk_y in range(top // self.chunk_tiles, bottom // self.chunk_tiles + 1):
+            for chunk_x in range(left // self.chunk_tiles, right // self.chunk_tiles + 1):
+                surface = self.get_chunk(chunk_y, chunk_x)
+
+                # Visible part of chunk in chunk pixels.
+                area_left = max(left * TILE_SIZE - chunk_x * chunk_size, 0)
+                area_top = max(top * TILE_SIZE - chunk_y * chunk_size, 0)
+                area_right = min((right + 1) * TILE_SIZE - chunk_x * chunk_size, surface.get_width())
+                area_bottom = min((bottom + 1) * TILE_SIZE - chunk_y * chunk_size, surface.get_height())
+                area = pygame.Rect(area_left, area_top, area_right - area_left, area_bottom - area_top)
+
+                position = (
+                    origin_x + chunk_x * chunk_size + area_left,
+                    origin_y + chunk_y * chunk_size + area_top
+                )
+                screen.blit(surface, position, area)
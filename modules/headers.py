@@ -8,9 +8,17 @@ START_GAME = "start_game"
 GAME_OVER = "game_over"
 
 ENEMY_UPDATE = "enemy_update"
+ENEMY_ENTER = "enemy_enter"
+ENEMY_LEAVE = "enemy_leave"
 PLAYER_UPDATE = "player_update"
+VISIBILITY_UPDATE = "visibility_update"
 ENV_UPDATE = "env_update"
 DESTROY_ENEMY = "destroy_enemy"
 BULLET_HIT = "bullet_hit"
 DEATH = "death"
 RENDER_BULLET = "render_bullet"
+WORLD_TICK = "world_tick"
+BULLETS_STATE = "bullets_state"
+
+# Events handled by the match server, other events from clients are ignored.
+CLIENT_EVENTS = {CLIENT_READY, PLAYER_UPDATE, VISIBILITY_UPDATE, ENV_UPDATE, BULLET_HIT, DEATH, RENDER_BULLET}
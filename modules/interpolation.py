@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from collections import deque
+import threading
+
+# Enemies are drawn this many seconds in the past, between two received states.
+DEFAULT_INTERPOLATION_DELAY = 0.1
+# How long position is predicted when newer state is late (then it settles back).
+MAX_EXTRAPOLATION = 0.1
+# Predicted offset from the newest state is limited to this many tiles.
+MAX_EXTRAPOLATION_DISTANCE = 0.5
+# Moves longer than this (respawns) are not animated.
+SNAP_DISTANCE = 2
+BUFFER_SIZE = 8
+
+
+@dataclass
+class TrackedState:
+    time: float
+    x: float
+    y: float
+    facing: int
+    # Inserted by the client (start of an animated move), not received.
+    is_inserted: bool = False
+
+
+def _clamp(value: float, limit: float) -> float:
+    return max(-limit, min(value, limit))
+
+
+class InterpolationBuffer:
+    """
+    Recent authoritative states of single enemy with their receive times.
+    `sample` returns position `delay` seconds in the past, interpolated between
+    the two states around that time. When newer state is late, position is
+    extrapolated from the last move for up to `max_extrapolation` seconds.
+    """
+    def __init__(self, delay: float = DEFAULT_INTERPOLATION_DELAY, max_extrapolation: float = MAX_EXTRAPOLATION) -> None:
+        self.delay = delay
+        self.max_extrapolation = max_extrapolation
+        self._states: deque[TrackedState] = deque(maxlen=BUFFER_SIZE)
+        self._lock = threading.Lock()
+
+    def push(self, x: int, y: int, facing: int, now: float) -> None:
+        with self._lock:
+            if self._states and now - self.delay > self._states[-1].time:
+                # Idle or late enemy: start new move from currently drawn position,
+                # so it is animated for `delay` seconds without a jump.
+                drawn = self._sample(now)
+                self._states.append(TrackedState(now - self.delay, drawn.x, drawn.y, drawn.facing, True))
+            self._states.append(TrackedState(now, x, y, facing))
+
+    def sample(self, now: float) -> TrackedState | None:
+        """ State to draw at `now` (its `time` is the sampled time). """
+        with self._lock:
+            if not self._states:
+                return None
+            return self._sample(now)
+
+    def is_animating(self, now: float) -> bool:
+        """ Sampled position still changes, so new frames are needed. """
+        with self._lock:
+            if not self._states:
+                return False
+            newest = self._states[-1]
+            can_extrapolate = len(self._states) > 1 and not self._states[-2].is_inserted
+            return now - self.delay < newest.time + (2 * self.max_extrapolation if can_extrapolate else 0)
+
+    def _sample(self, now: float) -> TrackedState:
+        render_time = now - self.delay
+        states = self._states
+
+        # States older than the pair around render time are not needed anymore.
+        while len(states) > 2 and states[1].time <= render_time:
+            states.popleft()
+
+        if len(states) == 1:
+            only = states[0]
+            return TrackedState(render_time, only.x, only.y, only.facing)
+
+        older, newer = states[0], states[1]
+        if render_time <= older.time:
+            return TrackedState(render_time, older.x, older.y, older.facing)
+        if render_time > newer.time:
+            return self._extrapolate(render_time, older, newer)
+
+        if abs(newer.x - older.x) > SNAP_DISTANCE or abs(newer.y - older.y) > SNAP_DISTANCE:
+            return TrackedState(render_time, newer.x, newer.y, newer.facing)
+
+        progress = (render_time - older.time) / max(newer.time - older.time, 1e-6)
+        return TrackedState(
+            render_time,
+            older.x + (newer.x - older.x) * progress,
+            older.y + (newer.y - older.y) * progress,
+            older.facing if progress < 0.5 else newer.facing
+        )
+
+    def _extrapolate(self, render_time: float, previous: TrackedState, newest: TrackedState) -> TrackedState:
+        late = render_time - newest.time
+        # Move from inserted state has no real speed to predict from.
+        if previous.is_inserted or late >= 2 * self.max_extrapolation:
+            return TrackedState(render_time, newest.x, newest.y, newest.facing)
+
+        # Offset grows while the update is late, then settles back to the newest state.
+        predicted_time = late if late <= self.max_extrapolation else 2 * self.max_extrapolation - late
+        duration = max(newest.time - previous.time, 1e-6)
+        offset_x = _clamp((newest.x - previous.x) / duration * predicted_time, MAX_EXTRAPOLATION_DISTANCE)
+        offset_y = _clamp((newest.y - previous.y) / duration * predicted_time, MAX_EXTRAPOLATION_DISTANCE)
+        if abs(newest.x - previous.x) > SNAP_DISTANCE or abs(newest.y - previous.y) > SNAP_DISTANCE:
+            offset_x = offset_y = 0
+        return TrackedState(render_time, newest.x + offset_x, newest.y + offset_y, newest.facing)
@@ -0,0 +1,86 @@
+import numpy as np
+import hashlib
+import os
+
+CACHE_DIR = "./.map_cache"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_EXT = ".npy"
+
+
+def cache_key(kind: str, *params) -> str:
+    """ Stable file name for given map kind and generation parameters. """
+    raw_key = ":".join([kind, *(repr(param) for param in params)])
+    return f"{kind}-{hashlib.sha1(raw_key.encode()).hexdigest()[:20]}"
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key + CACHE_EXT)
+
+
+def load(key: str) -> np.ndarray | None:
+    """
+    Memory-map cached map (copy-on-write, so callers may modify it freely).
+    Returns None on cache miss.
+    """
+    path = _cache_path(key)
+    try:
+        array = np.load(path, mmap_mode="c")
+    except (OSError, ValueError):
+        return None
+
+    # Mark as recently used for the LRU eviction.
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return array
+
+
+def store(key: str, array: np.ndarray) -> None:
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = _cache_path(key) + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, np.ascontiguousarray(array))
+        os.replace(tmp_path, _cache_path(key))
+    except OSError as error:
+        print(f"ERROR: Cannot store map in cache: {error}")
+        return
+
+    evict()
+
+
+def evict(max_bytes: int = None) -> None:
+    """ Remove least recently used maps until cache fits in `max_bytes`. """
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+
+    entries = []
+    try:
+        for entry in os.scandir(CACHE_DIR):
+            if entry.is_file() and entry.name.endswith(CACHE_EXT):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+
+
+def load_or_generate(key: str, generate_fn) -> np.ndarray:
+    """ Return cached map or generate, store and return it. """
+    array = load(key)
+    if array is not None:
+        return array
+
+    array = generate_fn()
+    store(key, array)
+    return array
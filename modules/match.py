@@ -0,0 +1,556 @@
+from modules import environment
+from modules import directions
+from modules import protocol
+from modules import metrics
+from modules import bullets
+from modules import spatial
+from modules import codec
+from modules import headers
+from modules import world
+
+import asyncio
+import socket
+import random
+import time
+
+PLAYER_COLORS = ["red", "blue", "orange"]
+SHUTDOWN_TIMEOUT = 1
+
+# Area of interest: enemies are sent to clients only when inside their visibility
+# extended by AOI_MARGIN. Bullets are sent to clients they can reach (BULLET_RANGE),
+# hits of players are detected by the hit player (see BULLET_HIT).
+DEFAULT_VISIBILITY = 5
+MAX_VISIBILITY = 13
+BULLET_RANGE = 26
+AOI_MARGIN = 2
+
+
+def is_int(value) -> bool:
+    """ Integer from a client message (JSON `true` / floats are not). """
+    return type(value) is int
+
+
+def check_visibility(visibility) -> int:
+    if not is_int(visibility) or visibility < 0:
+        raise ValueError(f"Invalid visibility: {visibility!r}")
+    return min(visibility, MAX_VISIBILITY)
+
+
+class ClientHandler:
+    def __init__(self, match: "Match", reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.match = match
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.color = match.get_player_color()
+        self.world = match.world
+        self.player_y, self.player_x = self.world.get_spawn_point()
+        self.state = {"color": self.color, "x": self.player_x, "y": self.player_y, "facing": 180}
+        self.visibility = DEFAULT_VISIBILITY
+        self.visible_enemies: set[str] = set()
+        self.observers: set[str] = set()
+        # States sent with ENEMY_ENTER since last tick, not repeated in WORLD_TICK (tick mode only).
+        self.entered_states: dict[str, dict] = {}
+        self.has_bullets_state = False
+        self.is_ready = False
+        self.codec_name = codec.CODEC_JSON
+        # Frames with their queueing time (for send latency), None closes the connection.
+        self._send_queue: asyncio.Queue[tuple[bytes, float] | None] = asyncio.Queue()
+        self.sender_task: asyncio.Task | None = None
+
+    async def run(self) -> None:
+        """ Send initial game data and handle client messages until disconnection. """
+        self.sender_task = asyncio.create_task(self.sender())
+        self.match.log(f"* Registered {self.color} player!")
+
+        self.send_frame(await self.match.get_world_snapshot_frame())
+        self.match.metrics.inc("messages_out_total", header=headers.GAME_INIT_WORLD_DATA)
+        self.send_to_client(headers.GAME_INIT_PLAYER_DATA, {
+            "color": self.color,
+            "spawn_x": self.player_x,
+            "spawn_y": self.player_y,
+            "codecs": codec.SUPPORTED_CODECS,
+            "server_bullets": self.match.bullets is not None
+        })
+
+        self.match.clients[self.color] = self
+        self.match.positions.update(self.color, self.player_x, self.player_y)
+        await self.receiver()
+
+    def check_position(self, x, y) -> None:
+        if not (is_int(x) and is_int(y) and 0 <= x < self.world.width and 0 <= y < self.world.height):
+            raise ValueError(f"Invalid position: {x!r}, {y!r}")
+
+    def check_own_color(self, color) -> None:
+        if color != self.color:
+            raise ValueError(f"Invalid color: {color!r}")
+
+    @property
+    def interest_radius(self) -> int:
+        return self.visibility + AOI_MARGIN
+
+    def sees(self, x: int, y: int) -> bool:
+        radius = self.interest_radius
+        return abs(x - self.player_x) <= radius and abs(y - self.player_y) <= radius
+
+    def sees_bullet(self, bullet: dict) -> bool:
+        """ Bullet can fly into the visible area before it disappears. """
+        radius = self.visibility + BULLET_RANGE + AOI_MARGIN
+        return abs(bullet["shot_x"] - self.player_x) <= radius and abs(bullet["shot_y"] - self.player_y) <= radius
+
+    def set_enemy_visible(self, enemy: "ClientHandler", is_visible: bool) -> bool:
+        """ Send enter / leave event when visibility of `enemy` changed, returns True if it did. """
+        if is_visible == (enemy.color in self.visible_enemies):
+            return False
+
+        if is_visible:
+            self.visible_enemies.add(enemy.color)
+            enemy.observers.add(self.color)
+            self.send_to_client(headers.ENEMY_ENTER, enemy.state)
+            if self.match.tick_rate:
+                self.entered_states[enemy.color] = enemy.state
+        else:
+            self.visible_enemies.discard(enemy.color)
+            enemy.observers.discard(self.color)
+            self.send_to_client(headers.ENEMY_LEAVE, {"color": enemy.color})
+        return True
+
+    def update_interest(self) -> list["ClientHandler"]:
+        """
+        Update areas of interest after this player moved or changed visibility.
+        Returns clients which already saw this player and still see it.
+        """
+        clients = self.match.clients
+        positions = self.match.positions
+
+        for color in positions.query(self.player_x, self.player_y, self.interest_radius) | self.visible_enemies:
+            enemy = clients.get(color)
+            if enemy is not None and enemy is not self:
+                self.set_enemy_visible(enemy, self.sees(enemy.player_x, enemy.player_y))
+
+        max_radius = MAX_VISIBILITY + AOI_MARGIN
+        still_observing = []
+        for color in positions.query(self.player_x, self.player_y, max_radius) | self.observers:
+            observer = clients.get(color)
+            if observer is None or observer is self:
+                continue
+            is_visible = observer.sees(self.player_x, self.player_y)
+            if not observer.set_enemy_visible(self, is_visible) and is_visible:
+                still_observing.append(observer)
+        return still_observing
+
+    def send_to_client(self, header: str, message: dict = {}) -> None:
+        self.send_encoded(codec.EncodedMessage(header, message))
+
+    def send_encoded(self, encoded: codec.EncodedMessage) -> None:
+        """ Send message shared between clients, encoded once per codec. """
+        match_metrics = self.match.metrics
+        is_encoded = encoded.is_encoded(self.codec_name)
+        started = time.perf_counter()
+        frame = encoded.get_frame(self.codec_name)
+        if not is_encoded:
+            match_metrics.observe("encode_seconds", time.perf_counter() - started, codec=self.codec_name)
+
+        match_metrics.inc("messages_out_total", header=encoded.header)
+        self.send_frame(frame)
+
+    def send_frame(self, frame: bytes) -> None:
+        """ Queue frame, it is written by the `sender` task. """
+        self.match.metrics.inc("bytes_out_total", len(frame))
+        self._send_queue.put_nowait((frame, time.perf_counter()))
+
+    def queued_frames(self) -> int:
+        return self._send_queue.qsize()
+
+    def close(self) -> None:
+        """ Close connection after all already queued frames are sent. """
+        self._send_queue.put_nowait(None)
+
+    async def sender(self) -> None:
+        try:
+            while True:
+                # Frames queued meanwhile are written together.
+                frames = [await self._send_queue.get()]
+                while not self._send_queue.empty():
+                    frames.append(self._send_queue.get_nowait())
+
+                self.writer.writelines([frame[0] for frame in frames if frame is not None])
+                await self.writer.drain()
+
+                match_metrics = self.match.metrics
+                if match_metrics.enabled:
+                    sent_at = time.perf_counter()
+                    for frame in frames:
+                        if frame is not None:
+                            match_metrics.observe("send_latency_seconds", sent_at - frame[1], client=self.color)
+                if None in frames:
+                    return
+
+        except OSError:
+            self.match.metrics.inc("errors_total", kind="send")
+            self.match.log(f"ERROR: cannot send message to: {self.color}")
+            self.match.remove_client(self.color)
+        finally:
+            self.writer.close()
+
+    async def receiver(self) -> None:
+        decoder = protocol.FrameDecoder()
+        match_metrics = self.match.metrics
+
+        while True:
+            try:
+                data = await self.reader.read(headers.CONN_BUFSIZE)
+                if not data:
+                    raise ConnectionError("Connection closed")
+                match_metrics.inc("bytes_in_total", len(data))
+                decoder.feed(data)
+
+                for msg_type, payload in decoder.frames():
+                    started = time.perf_counter()
+                    message = codec.decode_frame(msg_type, payload)
+                    decoded_at = time.perf_counter()
+                    match_metrics.observe("decode_seconds", decoded_at - started)
+                    if message is None:
+                        match_metrics.inc("errors_total", kind="decode")
+                        continue
+
+                    event_type = message.get("EVENT")
+                    # Event names come from clients, only known ones are used as metric labels.
+                    if event_type not in headers.CLIENT_EVENTS:
+                        match_metrics.inc("errors_total", kind="unknown_event")
+                        continue
+                    try:
+                        self.handle_message(message)
+                    except (ValueError, KeyError, TypeError, AttributeError) as error:
+                        # Malformed payload, the message is skipped.
+                        match_metrics.inc("errors_total", kind="decode")
+                        self.match.log(f"ERROR: Invalid {event_type} message from {self.color}: {error!r}")
+                        continue
+                    match_metrics.inc("messages_in_total", header=event_type)
+                    match_metrics.observe("handler_seconds", time.perf_counter() - decoded_at, header=event_type)
+
+            except OSError:
+                match_metrics.inc("disconnects_total")
+                self.match.log(f"* {self.color}: Connection stopped.")
+                self.match.remove_client(self.color)
+                self.close()
+                return
+
+    def handle_message(self, message: dict) -> None:
+        event_type = message.get("EVENT")
+        payload = message.get("PAYLOAD")
+        match = self.match
+
+        # Payloads are checked before any state changes, invalid message is skipped
+        # by the receiver (ValueError) and must not break the match for others.
+        if event_type == headers.CLIENT_READY:
+            visibility = self.visibility
+            if payload and "visibility" in payload:
+                visibility = check_visibility(payload["visibility"])
+            match.log(f"{self.color}: Client is ready ({len(match.clients)}/{match.players_amount})")
+            self.is_ready = True
+            if payload and payload.get("codec") in codec.SUPPORTED_CODECS:
+                self.codec_name = payload["codec"]
+            self.visibility = visibility
+            match.start_if_ready()
+
+        if event_type == headers.PLAYER_UPDATE:
+            self.check_own_color(payload["color"])
+            self.check_position(payload["x"], payload["y"])
+            if not is_int(payload["facing"]) or payload["facing"] not in directions.ALL_ANGLES:
+                raise ValueError(f"Invalid facing: {payload['facing']!r}")
+
+            self.player_x = payload["x"]
+            self.player_y = payload["y"]
+            self.state = payload
+            match.positions.update(self.color, self.player_x, self.player_y)
+            observers = self.update_interest()
+
+            if match.tick_rate:
+                match.pending_states[self.color] = payload
+                return
+
+            encoded = codec.EncodedMessage(headers.ENEMY_UPDATE, payload)
+            for client in observers:
+                client.send_encoded(encoded)
+
+        if event_type == headers.VISIBILITY_UPDATE:
+            self.visibility = check_visibility(payload["visibility"])
+            self.update_interest()
+
+        if event_type == headers.ENV_UPDATE:
+            self.check_position(payload["x"], payload["y"])
+            self.world.env_layer[payload["y"]][payload["x"]] = environment.import_env_voxel(payload["voxel"])
+            match.invalidate_world_snapshot()
+            match.spread_message(headers.ENV_UPDATE, payload)
+
+        if event_type == headers.BULLET_HIT:
+            # Sent by the hit player: shooter and players seeing the hit remove the bullet.
+            payload["target"] = self.color
+            encoded = codec.EncodedMessage(headers.BULLET_HIT, payload)
+            for color in self.observers | {payload["color"]}:
+                client = match.clients.get(color)
+                if client is not None and client is not self:
+                    client.send_encoded(encoded)
+
+        if event_type == headers.DEATH:
+            color = payload["color"]
+            match.remove_client(color)
+
+        if event_type == headers.RENDER_BULLET:
+            self.check_own_color(payload["color"])
+            self.check_position(payload["shot_x"], payload["shot_y"])
+            if not is_int(payload["bullet_id"]) or not 0 <= payload["bullet_id"] < codec.BULLET_ID_LIMIT:
+                raise ValueError(f"Invalid bullet id: {payload['bullet_id']!r}")
+            if not is_int(payload["direction"]) or payload["direction"] not in directions.ALL_ANGLES:
+                raise ValueError(f"Invalid direction: {payload['direction']!r}")
+
+            if match.bullets is not None:
+                match.bullets.add(payload["bullet_id"], payload["color"], payload["shot_x"], payload["shot_y"], payload["direction"])
+                return
+
+            if match.tick_rate:
+                match.pending_bullets.append(payload)
+                return
+
+            encoded = codec.EncodedMessage(headers.RENDER_BULLET, payload)
+            max_radius = MAX_VISIBILITY + BULLET_RANGE + AOI_MARGIN
+            for color in match.positions.query(payload["shot_x"], payload["shot_y"], max_radius):
+                client = match.clients.get(color)
+                if client is not None and client is not self and client.sees_bullet(payload):
+                    client.send_encoded(encoded)
+
+
+class Match:
+    """
+    Single game with its own world and players, all of its state lives in this
+    object so matches can run side by side (see `run_match`).
+    """
+    def __init__(self, match_id: int, players_amount: int, world_size: int, tick_rate: float = 0, simulate_bullets: bool = False, metrics_queue=None) -> None:
+        self.match_id = match_id
+        self.players_amount = min(players_amount, len(PLAYER_COLORS))
+        # Enemy states and bullets are sent aggregated `tick_rate` times per second (0: immediately).
+        self.tick_rate = tick_rate
+        self.world = world.World(height=world_size, width=world_size, seed=random.randint(1, 1000))
+        self.clients: dict[str, ClientHandler] = {}
+        self.positions = spatial.SpatialGrid()
+        # Changes waiting for the next tick (tick mode only).
+        self.pending_states: dict[str, dict] = {}
+        self.pending_bullets: list[dict] = []
+        # With server simulation clients only draw bullets from BULLETS_STATE.
+        self.bullets = bullets.BulletPool() if simulate_bullets else None
+        self.is_started = False
+        self.game_over = asyncio.Event()
+        self.winner = ""
+        # Metrics are pushed to the lobby through `metrics_queue` (None: disabled).
+        self.metrics_queue = metrics_queue
+        self.metrics = metrics.Metrics() if metrics_queue is not None else metrics.DisabledMetrics()
+        self._color_pointer = -1
+        self._tasks: set[asyncio.Task] = set()
+        # Snapshot frame shared by joining clients, None after env changed.
+        self._snapshot_frame: asyncio.Task | None = None
+
+    def log(self, text: str) -> None:
+        print(f"[match {self.match_id}] {text}")
+
+    async def get_world_snapshot_frame(self) -> bytes:
+        """ World snapshot frame for joining clients, encoded once until env changes. """
+        if self._snapshot_frame is None:
+            self._snapshot_frame = asyncio.create_task(asyncio.to_thread(
+                lambda: protocol.encode_frame(protocol.MSG_WORLD_SNAPSHOT, self.world.to_snapshot())
+            ))
+        return await self._snapshot_frame
+
+    def invalidate_world_snapshot(self) -> None:
+        self._snapshot_frame = None
+
+    def get_player_color(self) -> str:
+        self._color_pointer = (self._color_pointer + 1) % len(PLAYER_COLORS)
+        return PLAYER_COLORS[self._color_pointer]
+
+    def is_game_over(self) -> bool:
+        if not self.is_started:
+            return False
+        return len(self.clients) <= 1
+
+    def get_winner(self) -> str:
+        if not self.is_game_over():
+            return ""
+        if self.clients:
+            return list(self.clients.keys())[0].title()
+        return ""
+
+    def spread_message(self, header: str, message: dict = {}) -> None:
+        """ Send message to all active clients. """
+        started = time.perf_counter()
+        encoded = codec.EncodedMessage(header, message)
+        clients = list(self.clients.values())
+        for client in clients:
+            client.send_encoded(encoded)
+
+        self.metrics.inc("spread_recipients_total", len(clients), header=header)
+        self.metrics.observe("spread_seconds", time.perf_counter() - started, header=header)
+
+    def start_if_ready(self) -> None:
+        if self.is_started or len(self.clients) != self.players_amount:
+            return
+        for client in self.clients.values():
+            if not client.is_ready:
+                return
+
+        self.spread_message(headers.START_GAME)
+        self.is_started = True
+        self.log("=== GAME STARTED ===")
+
+    def remove_client(self, color: str) -> None:
+        if color in self.clients:
+            self.clients.pop(color)
+        self.pending_states.pop(color, None)
+        self.positions.remove(color)
+        for client in self.clients.values():
+            client.visible_enemies.discard(color)
+            client.observers.discard(color)
+
+        self.spread_message(headers.DESTROY_ENEMY, {"color": color})
+        if self.game_over.is_set():
+            return
+
+        if not self.is_started:
+            # Match cannot be completed anymore.
+            self.log("=== MATCH CANCELLED ===")
+            self.spread_message(headers.GAME_OVER)
+            self.game_over.set()
+
+        elif self.is_game_over():
+            self.winner = self.get_winner()
+            self.log(f"Winner: {self.winner}")
+            self.log("=== GAME OVER ===")
+            self.spread_message(headers.GAME_OVER)
+            self.game_over.set()
+
+    async def tick_loop(self) -> None:
+        """
+        Send every client states of visible enemies changed since last tick and
+        new bullets it can see as one WORLD_TICK message.
+        """
+        loop = asyncio.get_running_loop()
+        next_tick_at = loop.time()
+
+        while not self.game_over.is_set():
+            next_tick_at += 1 / self.tick_rate
+            await asyncio.sleep(max(next_tick_at - loop.time(), 0))
+
+            if not self.pending_states and not self.pending_bullets:
+                continue
+
+            states, bullets = self.pending_states, self.pending_bullets
+            self.pending_states = {}
+            self.pending_bullets = []
+
+            for client in list(self.clients.values()):
+                entered_states, client.entered_states = client.entered_states, {}
+                message = {
+                    "enemies": [
+                        states[color] for color in client.visible_enemies
+                        if color in states and states[color] is not entered_states.get(color)
+                    ],
+                    "bullets": [bullet for bullet in bullets if bullet["color"] != client.color and client.sees_bullet(bullet)]
+                }
+                if message["enemies"] or message["bullets"]:
+                    client.send_to_client(headers.WORLD_TICK, message)
+
+    def step_bullets(self) -> None:
+        """ Move all bullets of the match, resolve their hits and send bullets visible by clients. """
+        pool = self.bullets
+        clients = list(self.clients.values())
+        indices = pool.step(self.world)
+
+        player_hits = pool.hit_players(
+            indices,
+            [client.player_x for client in clients],
+            [client.player_y for client in clients],
+            [client.color for client in clients]
+        )
+        for _, player_index in player_hits:
+            clients[player_index].send_to_client(headers.BULLET_HIT)
+        indices = indices[pool.alive[indices]]
+
+        env_layer = self.world.env_layer
+        env_hits = pool.hit_env(indices, env_layer)
+        if env_hits:
+            self.invalidate_world_snapshot()
+        for _, x, y in env_hits:
+            self.spread_message(headers.ENV_UPDATE, {
+                "x": x, "y": y,
+                "voxel": environment.export_env_voxel(env_layer[y][x])
+            })
+        indices = indices[pool.alive[indices]]
+
+        xs, ys = pool.x[indices], pool.y[indices]
+        for client in clients:
+            radius = client.visibility + AOI_MARGIN
+            visible = indices[(abs(xs - client.player_x) <= radius) & (abs(ys - client.player_y) <= radius)]
+            if len(visible) or client.has_bullets_state:
+                client.send_to_client(headers.BULLETS_STATE, {"bullets": pool.to_payloads(visible)})
+                client.has_bullets_state = bool(len(visible))
+
+    async def bullets_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick_at = loop.time()
+
+        while not self.game_over.is_set():
+            next_tick_at += bullets.BULLET_TICK
+            await asyncio.sleep(max(next_tick_at - loop.time(), 0))
+            self.step_bullets()
+
+    async def metrics_loop(self) -> None:
+        while not self.game_over.is_set():
+            await asyncio.sleep(metrics.PUSH_INTERVAL)
+            self.update_gauges()
+            await asyncio.to_thread(metrics.push, self.metrics_queue, self.match_id, self.metrics)
+
+    def update_gauges(self) -> None:
+        for client in self.clients.values():
+            self.metrics.set("send_queue_depth", client.queued_frames(), match=self.match_id, client=client.color)
+        self.metrics.set("match_clients", len(self.clients), match=self.match_id)
+        if self.bullets is not None:
+            self.metrics.set("match_bullets", len(self.bullets), match=self.match_id)
+
+    async def close_clients(self) -> None:
+        """ Let remaining clients receive already queued messages (game over). """
+        clients = list(self.clients.values())
+        for client in clients:
+            client.close()
+
+        sender_tasks = [client.sender_task for client in clients if client.sender_task is not None]
+        if sender_tasks:
+            await asyncio.wait(sender_tasks, timeout=SHUTDOWN_TIMEOUT)
+
+    def _start_task(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self, connections: list[socket.socket]) -> str:
+        """ Play match with already connected players, returns the winner. """
+        if self.tick_rate:
+            self._start_task(self.tick_loop())
+        if self.bullets is not None:
+            self._start_task(self.bullets_loop())
+        if self.metrics.enabled:
+            self._start_task(self.metrics_loop())
+
+        for connection in connections:
+            reader, writer = await asyncio.open_connection(sock=connection)
+            self._start_task(ClientHandler(self, reader, writer).run())
+
+        await self.game_over.wait()
+        await self.close_clients()
+        if self.metrics.enabled:
+            await asyncio.to_thread(metrics.push, self.metrics_queue, self.match_id, self.metrics, True)
+        return self.winner
+
+
+def run_match(match_id: int, connections: list[socket.socket], players_amount: int, world_size: int, tick_rate: float = 0, simulate_bullets: bool = False, metrics_queue=None) -> str:
+    """ Entry point of match worker process. """
+    return asyncio.run(Match(match_id, players_amount, world_size, tick_rate, simulate_bullets, metrics_queue).run(connections))
@@ -0,0 +1,238 @@
+from bisect import bisect_left
+import asyncio
+import queue
+import json
+import time
+import os
+
+METRIC_PREFIX = "dino_"
+# Upper bounds (seconds) of duration histogram buckets.
+DURATION_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# Match workers send their metrics to the lobby this often (seconds).
+PUSH_INTERVAL = 1
+DUMP_INTERVAL = 10
+DUMP_PATH = "./metrics.json"
+HTTP_HOST = "127.0.0.1"
+HTTP_READ_TIMEOUT = 5
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+class Histogram:
+    """ Count of values per bucket (not cumulative), `counts[-1]` are values above the last bucket. """
+    def __init__(self, buckets: tuple = DURATION_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        return {"buckets": list(self.buckets), "counts": self.counts, "sum": self.sum, "count": self.count}
+
+    def merge(self, data: dict) -> None:
+        if tuple(data["buckets"]) != self.buckets:
+            print("ERROR: Cannot merge histograms with different buckets")
+            return
+        self.counts = [count + other for count, other in zip(self.counts, data["counts"])]
+        self.sum += data["sum"]
+        self.count += data["count"]
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms keyed by name and labels. `snapshot` is made
+    of plain lists and dicts, so it can be sent between processes and merged.
+    """
+    enabled = True
+
+    def __init__(self) -> None:
+        self.counters: dict[tuple, float] = {}
+        self.gauges: dict[tuple, float] = {}
+        self.histograms: dict[tuple, Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        return {
+            "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+            "gauges": [[name, dict(labels), value] for (name, labels), value in self.gauges.items()],
+            "histograms": [[name, dict(labels), histogram.to_dict()] for (name, labels), histogram in self.histograms.items()],
+        }
+
+    def merge(self, snapshot: dict) -> None:
+        """ Add counters and histograms of `snapshot`, its gauges replace current ones. """
+        for name, labels, value in snapshot["counters"]:
+            self.inc(name, value, **labels)
+        for name, labels, value in snapshot["gauges"]:
+            self.set(name, value, **labels)
+        for name, labels, data in snapshot["histograms"]:
+            key = _key(name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(tuple(data["buckets"]))
+            histogram.merge(data)
+
+
+class DisabledMetrics(Metrics):
+    """ Drops everything, used when metrics are off. """
+    enabled = False
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        pass
+
+    def set(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        pass
+
+
+def _escape_label_value(value) -> str:
+    """ Label value escaped as required by the text format. """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict, extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label_value(value)}"' for name, value in sorted(labels.items())]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def to_prometheus(snapshot: dict) -> str:
+    """ `Metrics.snapshot` in Prometheus text exposition format. """
+    lines = []
+    for kind, entries in [("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])]:
+        typed = set()
+        for name, labels, value in sorted(entries, key=lambda entry: entry[0]):
+            if name not in typed:
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+                typed.add(name)
+            lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {value}")
+
+    typed = set()
+    for name, labels, data in sorted(snapshot["histograms"], key=lambda entry: entry[0]):
+        if name not in typed:
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+            typed.add(name)
+
+        cumulative = 0
+        for bucket, count in zip([*data["buckets"], "+Inf"], data["counts"]):
+            cumulative += count
+            bucket_label = f'le="{bucket}"'
+            lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels, bucket_label)} {cumulative}")
+        lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {data['sum']}")
+        lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {data['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsCollector:
+    """
+    Lobby side: metrics of running matches (replaced on every push), totals of
+    finished matches and lobby's own metrics. Gauges of finished matches are dropped.
+    """
+    def __init__(self, metrics_queue) -> None:
+        self.queue = metrics_queue
+        self.lobby = Metrics()
+        self.finished = Metrics()
+        self.running: dict[int, dict] = {}
+
+    def combined(self) -> Metrics:
+        combined = Metrics()
+        combined.merge(self.lobby.snapshot())
+        combined.merge(self.finished.snapshot())
+        for snapshot in self.running.values():
+            combined.merge(snapshot)
+        return combined
+
+    def discard(self, match_id: int) -> None:
+        """ Drop metrics of match which failed before its final push. """
+        self.running.pop(match_id, None)
+
+    async def receive(self) -> None:
+        """ Apply pushes of match workers (see `push`). """
+        while True:
+            try:
+                is_final, match_id, snapshot = await asyncio.to_thread(self.queue.get, True, PUSH_INTERVAL)
+            except queue.Empty:
+                continue
+
+            if not is_final:
+                self.running[match_id] = snapshot
+                continue
+
+            self.running.pop(match_id, None)
+            snapshot["gauges"] = []
+            self.finished.merge(snapshot)
+
+    async def dump(self, path: str = DUMP_PATH, interval: float = DUMP_INTERVAL) -> None:
+        """ Periodically write combined metrics as JSON. """
+        while True:
+            await asyncio.sleep(interval)
+            data = {"time": time.time(), "metrics": self.combined().snapshot()}
+            try:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as file:
+                    json.dump(data, file)
+                os.replace(tmp_path, path)
+            except OSError as error:
+                print(f"ERROR: Cannot write metrics dump: {error}")
+
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HTTP_READ_TIMEOUT)
+            path = request.split(b" ")[1].decode(errors="replace") if request.count(b" ") >= 2 else ""
+
+            if path == "/metrics":
+                status, content_type = "200 OK", "text/plain; version=0.0.4"
+                body = to_prometheus(self.combined().snapshot()).encode()
+            elif path == "/metrics.json":
+                status, content_type = "200 OK", "application/json"
+                body = json.dumps(self.combined().snapshot()).encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, port: int) -> None:
+        """ Prometheus (`/metrics`) and JSON (`/metrics.json`) endpoint on localhost. """
+        server = await asyncio.start_server(self.handle_http, HTTP_HOST, port)
+        print(f"Metrics are served on: http://{HTTP_HOST}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+
+def push(metrics_queue, match_id: int, metrics: Metrics, is_final: bool = False) -> None:
+    """ Send match metrics to the lobby (blocking, run it in a thread). """
+    try:
+        metrics_queue.put((is_final, match_id, metrics.snapshot()))
+    except (OSError, EOFError) as error:
+        print(f"ERROR: Cannot send metrics of match {match_id}: {error}")
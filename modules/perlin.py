@@ -1,8 +1,13 @@
 import matplotlib.pyplot as plt
-from perlin_noise import PerlinNoise
+from perlin_noise.tools import hasher, sample_vector
+import numpy as np
 
 PERLIN_MIN = -0.6
 PERLIN_MAX = 0.6
+# Normalized values are multiples of 0.01, lookup tables have one entry per value.
+PERLIN_LUT_SIZE = round((PERLIN_MAX - PERLIN_MIN) * 100) + 1
+# Bump when generated values change, invalidates cached maps.
+GENERATOR_VERSION = 1
 
 
 def normalize_noise(value: float) -> float:
@@ -10,14 +15,94 @@ def normalize_noise(value: float) -> float:
         value = PERLIN_MIN
     if value > PERLIN_MAX:
         value = PERLIN_MAX
-        
+
     return round(value, 2)
 
 
+def normalize_noise_array(values: np.ndarray) -> np.ndarray:
+    """ Vectorized `normalize_noise` (clip and round to 0.01). """
+    return np.round(np.clip(values, PERLIN_MIN, PERLIN_MAX), 2)
+
+
+def lut_index(values) -> np.ndarray:
+    """ Index of normalized value(s) in lookup tables of `PERLIN_LUT_SIZE` entries. """
+    return np.rint(np.asarray(values, dtype=np.float64) * 100).astype(np.intp) - round(PERLIN_MIN * 100)
+
+
+def lut_values() -> list[float]:
+    """ Normalized value of every lookup table entry. """
+    return [(index + round(PERLIN_MIN * 100)) / 100 for index in range(PERLIN_LUT_SIZE)]
+
+
+def _fade(values: np.ndarray) -> np.ndarray:
+    return values * values * values * (values * (values * 6 - 15) + 10)
+
+
+def _lattice_gradients(seed: int, rows: range, cols: range) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Gradient vectors for every lattice point in `rows` x `cols`.
+    Uses the perlin_noise helpers, so each vector matches `PerlinNoise` for the same seed.
+    """
+    grad_a = np.empty((len(rows), len(cols)), dtype=np.float64)
+    grad_b = np.empty((len(rows), len(cols)), dtype=np.float64)
+
+    for r_index, row in enumerate(rows):
+        for c_index, col in enumerate(cols):
+            grad_a[r_index, c_index], grad_b[r_index, c_index] = sample_vector(2, seed * hasher((row, col)))
+
+    return grad_a, grad_b
+
+
+def generate_perlin_array(height: int = 100, width: int = 100, seed: int = 10, octaves: int = 10,
+                          top: int = 0, left: int = 0, rows: int = None, cols: int = None) -> np.ndarray:
+    """
+    Whole perlin map as a float32 array computed in a few vectorized passes.
+    Values are equal to the `PerlinNoise` based generator after `normalize_noise`.
+    `top`, `left`, `rows` and `cols` select a region of the map (used by chunks).
+    """
+    if rows is None:
+        rows = height - top
+    if cols is None:
+        cols = width - left
+    if rows <= 0 or cols <= 0:
+        return np.zeros((max(rows, 0), max(cols, 0)), dtype=np.float32)
+
+    # Same coordinates as `PerlinNoise([i/width, j/height])` would scale.
+    coords_a = (np.arange(top, top + rows, dtype=np.float64) / width) * octaves
+    coords_b = (np.arange(left, left + cols, dtype=np.float64) / height) * octaves
+    floor_a = np.floor(coords_a).astype(np.int64)
+    floor_b = np.floor(coords_b).astype(np.int64)
+
+    min_a, min_b = int(floor_a.min()), int(floor_b.min())
+    grad_a, grad_b = _lattice_gradients(
+        seed,
+        range(min_a, int(floor_a.max()) + 2),
+        range(min_b, int(floor_b.max()) + 2)
+    )
+
+    noise = np.zeros((rows, cols), dtype=np.float64)
+    for corner_a in (0, 1):
+        lattice_a = floor_a + corner_a
+        dist_a = (coords_a - lattice_a)[:, None]
+
+        for corner_b in (0, 1):
+            lattice_b = floor_b + corner_b
+            dist_b = (coords_b - lattice_b)[None, :]
+
+            lattice_index = np.ix_(lattice_a - min_a, lattice_b - min_b)
+            weight = _fade(1 - np.abs(dist_a)) * _fade(1 - np.abs(dist_b))
+            noise += weight * (grad_a[lattice_index] * dist_a + grad_b[lattice_index] * dist_b)
+
+    return normalize_noise_array(noise).astype(np.float32)
+
+
+def perlin_array_to_list(perlin_map: np.ndarray) -> list[list[float]]:
+    # Back to float64 before rounding, so values like 0.35 are not shifted by float32.
+    return np.round(np.asarray(perlin_map, dtype=np.float64), 2).tolist()
+
+
 def generate_perlin_map(height: int = 100, width: int = 100, seed: int = 10, octaves: int = 10) -> list[list[float]]:
-    noise = PerlinNoise(octaves=octaves, seed=seed)
-    perlin_map = [[normalize_noise(noise([i/width, j/height])) for j in range(width)] for i in range(height)]
+    perlin_map = perlin_array_to_list(generate_perlin_array(height, width, seed, octaves))
     # plt.imshow(perlin_map, cmap='gray')
     # plt.show()
     return perlin_map
-
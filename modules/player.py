@@ -1,6 +1,14 @@
 from modules import collectables
 from modules import environment
 from modules import directions
+from modules import ground_cache
+from modules import render_loop
+from modules import interpolation
+from modules import profiler
+from modules import protocol
+from modules import bullets
+from modules import codec
+from modules import textures
 from modules import headers
 from modules import helpers
 from modules import voxels
@@ -8,14 +16,16 @@ from modules import voxels
 from dataclasses import dataclass, asdict
 from datetime import datetime, timedelta
 import threading
+import numpy as np
 import pygame
 import time
-import uuid
-import json
 import sys
 
 pygame.font.init()
 GUI_FONT = pygame.font.Font("./textures/ui/font.ttf", 32)
+HUD_HEIGHT = 48
+BULLET_DAMAGE = 25
+RELOAD_ROUND_TIME = 0.1
 
 
 def drop_shadow_text(screen, text, x, y, color=(255,255,255), drop_color=(128,128,128)):
@@ -25,11 +35,20 @@ def drop_shadow_text(screen, text, x, y, color=(255,255,255), drop_color=(128,12
     text_bitmap = GUI_FONT.render(text, True, color)
     screen.blit(text_bitmap, (x, y))
 
+
+def get_water_alpha(ground_voxel: voxels.GroundVoxel) -> int | None:
+    """ Alpha of sprite standing on `ground_voxel` (see `textures.WATER_ALPHAS`). """
+    if ground_voxel == voxels.deep_water:
+        return 140
+    if ground_voxel == voxels.shallow_water:
+        return 220
+    return None
+
         
 @dataclass
 class Enemy:
-    x: int
-    y: int
+    x: int | float
+    y: int | float
     color: str
     facing: directions.AngleDirection
 
@@ -38,12 +57,19 @@ class Enemy:
 class RenderData:
     x_offset: int
     y_offset: int
-    voxel_map: list
+    margins: "RenderMargins"
     env_map: list
     bullets: list
     enemies: list[Enemy]
 
 
+@dataclass
+class FrameState:
+    camera: tuple
+    tiles: dict[tuple[int, int], list]
+    hud: tuple
+
+
 @dataclass
 class RenderMargins:
     top_index: int
@@ -56,7 +82,7 @@ class RenderMargins:
 
 @dataclass
 class BulletPayload:
-    bullet_id: str
+    bullet_id: int
     color: str
     shot_x: int
     shot_y: int
@@ -69,132 +95,155 @@ class BulletPayload:
         
 
 class BulletsManager:
+    """
+    Bullets stored in `bullets.BulletPool`, all of them are moved by one
+    persistent ticker thread every `bullets.BULLET_TICK` seconds. With server
+    bullets there is no ticker, the pool only mirrors the server state.
+    """
     def __init__(self, player) -> None:
         self.player: Player = player
-        self.active_bullets: list[BulletPayload] = []
-        self._remove = []
-        self._is_ticking = False
+        self.pool = bullets.BulletPool()
+        self._lock = threading.Lock()
+        self._has_bullets = threading.Event()
+        self._ticker = None
+        if not self.player.server_bullets:
+            self._ticker = threading.Thread(target=self._ticking, daemon=True)
+            self._ticker.start()
     
     def add_bullet(self, bullet: BulletPayload) -> None:
-        self.active_bullets.append(bullet)
-        if not self._is_ticking:
-            self.start_tick()
-        
-    def remove_bullet(self, bullet) -> None:
-        if bullet.bullet_id not in self._remove:
-            self._remove.append(bullet.bullet_id)
-        
-    def start_tick(self):
-        self._is_ticking = True
+        with self._lock:
+            self.pool.add(bullet.bullet_id, bullet.color, bullet.shot_x, bullet.shot_y, bullet.direction)
+            self._has_bullets.set()
+        
+    def remove_bullet(self, color: str, bullet_id: int) -> bool:
+        with self._lock:
+            index = self.pool.find(color, bullet_id)
+            if index is None:
+                return False
+            self.pool.kill(index)
+            return True
         
-        def ticking():
-            while self.active_bullets:
-                is_bullet_in_viewport = False
-                
-                for bullet in self.active_bullets:
-                    if bullet.bullet_id in self._remove:
-                        self.active_bullets.remove(bullet)
-                        self._remove.remove(bullet.bullet_id)
-                        is_bullet_in_viewport = True
-                        continue
-                    
-                    if bullet.direction == directions.AngleDirection.N:
-                        bullet.y -= 1
-                    if bullet.direction == directions.AngleDirection.S:
-                        bullet.y += 1
-                    if bullet.direction == directions.AngleDirection.E:
-                        bullet.x += 1
-                    if bullet.direction == directions.AngleDirection.W:
-                        bullet.x -= 1
-                        
-                    bullet.moved += 1
-                    if bullet.moved > 25:
-                        self.remove_bullet(bullet)
-                        is_bullet_in_viewport = True
-                        continue
-                
-                    if bullet.x < 0 or bullet.x > len(self.player.world.voxel_world[0]) - 1 or bullet.y < 0 or bullet.y > len(self.player.world.voxel_world) - 1:
-                        self.remove_bullet(bullet)
-                        is_bullet_in_viewport = True
-                        continue
-                    
-                    if self.player.world.voxel_world[bullet.y][bullet.x] in (voxels.stone, voxels.snow):
-                        self.remove_bullet(bullet)
-                        is_bullet_in_viewport = True
-                        continue
-                    
-                    if bullet.color == self.player.color:
-                        for enemy in self.player.enemies.values():
-                            if (bullet.x, bullet.y) == (enemy.x, enemy.y):
-                                self.player.send_event(headers.BULLET_HIT, {"target": enemy.color})
-                                self.remove_bullet(bullet)
-                                is_bullet_in_viewport = True
-                                continue
-                            
-                    if isinstance(self.player.world.env_layer[bullet.y][bullet.x], environment.EnvVoxel):
-                        shot_feedback = self.player.world.env_layer[bullet.y][bullet.x].on_shot()
-
-                        if shot_feedback.remove_voxel:
-                            self.player.world.env_layer[bullet.y][bullet.x] = None
-                            
-                        if not shot_feedback.continue_fly:
-                            self.remove_bullet(bullet)
-                        
-                        if bullet.color == self.player.color:
-                            self.player.send_env_update(bullet.x, bullet.y)
-
-                        is_bullet_in_viewport = True
-                            
-                    if bullet.x in range(self.player.x - self.player.visibility - 1, self.player.x + self.player.visibility + 1) and bullet.y in range(self.player.y - self.player.visibility - 1, self.player.y + self.player.visibility + 1):
-                        is_bullet_in_viewport = True                       
-                        
-                if is_bullet_in_viewport:
-                    self.player.render(force=False)
-                
-                time.sleep(0.1)
+    def set_bullets(self, bullets_state: list[BulletPayload]) -> None:
+        """ Replace bullets with state simulated by the server (no local ticking). """
+        with self._lock:
+            self.pool.kill(self.pool.alive_indices())
+            for bullet in bullets_state:
+                self.pool.add(bullet.bullet_id, bullet.color, bullet.shot_x, bullet.shot_y, bullet.direction)
                 
-            self._is_ticking = False
+    def get_bullets(self, left: int, top: int, right: int, bottom: int) -> list[BulletPayload]:
+        """ Bullets with `left` <= x < `right` and `top` <= y < `bottom`. """
+        with self._lock:
+            pool = self.pool
+            indices = pool.alive_indices()
+            xs, ys = pool.x[indices], pool.y[indices]
+            return [
+                BulletPayload(bullet["bullet_id"], bullet["color"], bullet["x"], bullet["y"], bullet["direction"])
+                for bullet in pool.to_payloads(indices[(xs >= left) & (xs < right) & (ys >= top) & (ys < bottom)])
+            ]
+        
+    def tick(self) -> bool:
+        """ Move all bullets and resolve their hits. Returns True if view should be redrawn. """
+        player = self.player
+        
+        with self._lock:
+            pool = self.pool
+            flying_before = len(pool)
+            indices = pool.step(player.world)
+            
+            # Hits are detected by the hit player, enemies report hits of own bullets back.
+            player_hits = [
+                (int(pool.bullet_id[index]), codec.COLORS[pool.color[index]])
+                for index, _ in pool.hit_players(indices, [player.x], [player.y], [player.color])
+            ]
+            # Own bullets stop at known enemies too (so they never hit env behind them),
+            # the hit itself is reported by the enemy.
+            enemies = list(player.enemies.values())
+            own_indices = indices[pool.color[indices] == codec.COLOR_IDS[player.color]]
+            pool.hit_players(own_indices, [enemy.x for enemy in enemies], [enemy.y for enemy in enemies], [enemy.color for enemy in enemies])
+            indices = indices[pool.alive[indices]]
             
-        ticker = threading.Thread(target=ticking, daemon=True)
-        ticker.start()
+            env_hits = pool.hit_env(indices, player.world.env_layer)
+            own_env_hits = [(x, y) for index, x, y in env_hits if pool.color[index] == codec.COLOR_IDS[player.color]]
+            
+            indices = indices[pool.alive[indices]]
+            xs, ys = pool.x[indices], pool.y[indices]
+            view_radius = player.visibility + 1
+            is_in_viewport = bool(np.any((abs(xs - player.x) <= view_radius) & (abs(ys - player.y) <= view_radius)))
+            is_changed = is_in_viewport or bool(env_hits) or len(indices) < flying_before
+            
+            if not len(pool):
+                self._has_bullets.clear()
+            
+        for bullet_id, color in player_hits:
+            player.send_event(headers.BULLET_HIT, {"target": player.color, "color": color, "bullet_id": bullet_id})
+            player.deal_damage(BULLET_DAMAGE)
+        for x, y in own_env_hits:
+            player.send_env_update(x, y)
+        return is_changed
+        
+    def _ticking(self) -> None:
+        while True:
+            self._has_bullets.wait()
+            if self.tick():
+                self.player.render()
+            time.sleep(bullets.BULLET_TICK)
                 
                     
 class AmmunitionManager:
+    """
+    Rounds are loaded one by one every `RELOAD_ROUND_TIME` seconds by a reload
+    thread (main thread draws frames meanwhile), shooting is not possible until it ends.
+    """
     def __init__(self, loaded: int, unloaded: int, mag_capacity: int, draw_fn) -> None:
         self.loaded = loaded
         self.unloaded = unloaded
         self.mag_capacity = mag_capacity
         self.draw_fn = draw_fn
+        self.is_reloading = False
+        self._lock = threading.Lock()
         
     def __str__(self) -> str:
         return f"{self.loaded}/{self.unloaded}"
         
     def shot(self) -> bool:
         """ Removes loaded round. Returns status (can shoot). """
-        if self.loaded > 0:
-            self.loaded -= 1
-            return True
-        return False
+        with self._lock:
+            if self.loaded > 0 and not self.is_reloading:
+                self.loaded -= 1
+                return True
+            return False
     
     def reload(self) -> None:
-        to_load = self.mag_capacity-self.loaded
-        for _ in range(to_load):
-            if self.unloaded <= 0:
-                break
-            else:
-                self.unloaded -= 1
-                self.loaded += 1
+        """ Start reloading, does not block the caller. """
+        with self._lock:
+            if self.is_reloading:
+                return
+            self.is_reloading = True
+        threading.Thread(target=self._reloading, daemon=True).start()
+        
+    def _reloading(self) -> None:
+        try:
+            while True:
+                with self._lock:
+                    if self.loaded >= self.mag_capacity or self.unloaded <= 0:
+                        return
+                    self.unloaded -= 1
+                    self.loaded += 1
                 self.draw_fn()
-                time.sleep(0.1)
+                time.sleep(RELOAD_ROUND_TIME)
+        finally:
+            with self._lock:
+                self.is_reloading = False
                 
     def add_ammo(self, amount: int) -> None:
-        self.unloaded += amount
+        with self._lock:
+            self.unloaded += amount
         if self.unloaded > 99:
             self.unloaded = 99
         
                     
 class Player:
-    def __init__(self, screen, world, client, color: str, walk_cooldown: float = 0.25, init_spawn: tuple[int, int] = None):
+    def __init__(self, screen, world, client, color: str, walk_cooldown: float = 0.25, init_spawn: tuple[int, int] = None, target_fps: int = render_loop.DEFAULT_TARGET_FPS, stream_decoder: protocol.FrameDecoder = None, codec_name: str = codec.CODEC_JSON, server_bullets: bool = False, interpolation_delay: float = interpolation.DEFAULT_INTERPOLATION_DELAY):
         if init_spawn is None:
             self.y, self.x = world.get_spawn_point()
         else:
@@ -204,8 +253,10 @@ class Player:
         self.speedness = 0
         self.facing = directions.AngleDirection.S
         self.world = world
+        self.ground_cache = ground_cache.GroundCache(world)
         self.screen: pygame.Surface = screen
         self.color = color
+        self.server_bullets = server_bullets
         self.bullets_manager = BulletsManager(self)
         self.walk_cooldown = walk_cooldown
         self.shoot_cooldown = 0.5
@@ -215,39 +266,47 @@ class Player:
         self.health = 100
         self.is_started = False
         self.client = client
+        self.stream_decoder = stream_decoder or protocol.FrameDecoder()
+        self._send_lock = threading.Lock()
+        self.codec_name = codec_name
+        self._next_bullet_id = 0
         self.enemies: dict[str, Enemy] = {}
+        # Drawn enemy positions, `enemies` hold the newest received states.
+        self.enemy_tracks: dict[str, interpolation.InterpolationBuffer] = {}
+        self.interpolation_delay = interpolation_delay
         self.exit_game = False
-        self._redner_lock = False
+        self._last_frame: FrameState | None = None
+        self.profiler = profiler.FrameProfiler()
+        
+        self.render_loop = render_loop.RenderLoop(self.draw_frame, target_fps)
         
         self.stream_receiver = threading.Thread(target=self.game_stream_receiver, daemon=True)
         self.stream_receiver.start()
 
-        self.send_event(headers.CLIENT_READY)
+        self.send_event(headers.CLIENT_READY, {"codec": self.codec_name, "visibility": self.visibility})
 
         self.render()
         self.input_handler()
         
     def send_event(self, event_type: str, payload: dict = {}) -> None:
         """ Send event to server. """
-        data = {
-            "EVENT": event_type,
-            "PAYLOAD": payload
-        }
-        self.client.send((json.dumps(data)+";").encode())
+        frame = codec.encode_frame(event_type, payload, self.codec_name)
+        with self._send_lock:
+            self.client.sendall(frame)
             
     def game_stream_receiver(self) -> None:
         """ Receive and process all data from server. """
         while True:
             try:
-                data = self.client.recv(headers.CONN_BUFSIZE).decode()
-                packets = data.split(";")
-                for p in packets:
-                    if not p:
-                        continue
-                    message = json.loads(p)
-                    self.handle_server_message(message)
+                for msg_type, payload in self.stream_decoder.frames():
+                    message = codec.decode_frame(msg_type, payload)
+                    if message is not None:
+                        self.handle_server_message(message)
+                
+                if not self.stream_decoder.recv_from(self.client):
+                    raise ConnectionError("Connection closed")
                     
-            except ConnectionError:
+            except OSError:
                 print("ERROR: Server stopped.")
                 self.exit_game = True
                 return
@@ -261,19 +320,21 @@ class Player:
             self.render()
             self.send_player_state_update()
             
-        if event_type == headers.ENEMY_UPDATE:
-            self.enemies[payload["color"]] = Enemy(**payload)
+        if event_type in (headers.ENEMY_UPDATE, headers.ENEMY_ENTER):
+            self.update_enemy(payload, is_entering=event_type == headers.ENEMY_ENTER)
             self.render()
             
+        if event_type == headers.ENEMY_LEAVE:
+            if self.remove_enemy(payload["color"]):
+                self.render()
+            
         if event_type == headers.ENV_UPDATE:
             new_voxel = environment.import_env_voxel(payload.get("voxel"))
             self.world.env_layer[payload.get("y")][payload.get("x")] = new_voxel
             self.render()
             
         if event_type == headers.DESTROY_ENEMY:
-            color = payload.get("color")
-            if color in self.enemies:
-                self.enemies.pop(color)
+            if self.remove_enemy(payload.get("color")):
                 self.render()
             
         if event_type == headers.GAME_OVER:
@@ -282,13 +343,52 @@ class Player:
             sys.exit()
             
         if event_type == headers.BULLET_HIT:
-            self.deal_damage(25)
-            self.render()
+            # Hit of an enemy (reported by it) or of this player (server bullets).
+            if payload and payload.get("target") != self.color:
+                if self.bullets_manager.remove_bullet(payload["color"], payload["bullet_id"]):
+                    self.render()
+            else:
+                self.deal_damage(BULLET_DAMAGE)
             
         if event_type == headers.RENDER_BULLET:
             bullet_data = BulletPayload(**payload)
             self.bullets_manager.add_bullet(bullet_data)
             
+        if event_type == headers.BULLETS_STATE:
+            self.bullets_manager.set_bullets([
+                BulletPayload(bullet["bullet_id"], bullet["color"], bullet["x"], bullet["y"], bullet["direction"])
+                for bullet in payload["bullets"]
+            ])
+            self.render()
+            
+        if event_type == headers.WORLD_TICK:
+            for enemy_payload in payload["enemies"]:
+                if enemy_payload["color"] != self.color:
+                    self.update_enemy(enemy_payload)
+            for bullet_payload in payload["bullets"]:
+                if bullet_payload["color"] != self.color:
+                    self.bullets_manager.add_bullet(BulletPayload(**bullet_payload))
+            self.render()
+            
+    def update_enemy(self, payload: dict, is_entering: bool = False) -> None:
+        """ Store newest enemy state, entering enemy is drawn at once (not moved from last known place). """
+        enemy = Enemy(**payload)
+        self.enemies[enemy.color] = enemy
+        
+        track = self.enemy_tracks.get(enemy.color)
+        if track is None or is_entering:
+            track = interpolation.InterpolationBuffer(self.interpolation_delay)
+            self.enemy_tracks[enemy.color] = track
+        track.push(enemy.x, enemy.y, enemy.facing, time.perf_counter())
+        
+    def remove_enemy(self, color: str) -> bool:
+        self.enemy_tracks.pop(color, None)
+        return self.enemies.pop(color, None) is not None
+        
+    def is_enemy_animating(self) -> bool:
+        now = time.perf_counter()
+        return any(track.is_animating(now) for track in list(self.enemy_tracks.values()))
+        
     def send_player_state_update(self) -> None:
         data = {
             "color": self.color,
@@ -307,14 +407,8 @@ class Player:
         self.send_event(headers.ENV_UPDATE, data)
             
     def get_player_texture(self) -> pygame.Surface:
-        image = pygame.image.load(f"./textures/players/{self.color}.png").convert_alpha()
-        
-        if self.get_ground_block() == voxels.deep_water:
-            image.set_alpha(140)
-        if self.get_ground_block() == voxels.shallow_water:
-            image.set_alpha(220)
-        
-        return pygame.transform.rotate(image, -self.facing)
+        alpha = get_water_alpha(self.get_ground_block())
+        return textures.get_variant(textures.player_path(self.color), self.facing, alpha)
 
     def deal_damage(self, damage: int) -> None:
         self.health -= damage
@@ -354,8 +448,7 @@ class Player:
                 rolled_back = True
                 
         if not rolled_back:
-            ground_voxel = self.get_ground_block()
-            if ground_voxel in (voxels.stone, voxels.snow):
+            if not self.world.ground.is_walkable(self.x, self.y):
                 self.x = past_x
                 self.y = past_y
                 rolled_back = True
@@ -380,7 +473,7 @@ class Player:
             if isinstance(self.world.env_layer[surr_pos[1]][surr_pos[0]], environment.Cactus):
                 self.deal_damage(10)
                 
-        self.slowness = self.get_ground_block().voxel_slowness
+        self.slowness = self.world.ground.slowness(self.x, self.y)
         self.render()  
         
     def update_facing(self, facing: directions.AngleDirection) -> None:
@@ -397,9 +490,24 @@ class Player:
             height_boost = 7
         
         self.visibility = new_value
+        self.send_event(headers.VISIBILITY_UPDATE, {"visibility": new_value})
         screen_size = 200 + (height_boost * 100)
-        pygame.display.set_mode((screen_size + width_boost, screen_size))
-        self.render()
+        
+        def resize_screen() -> None:
+            self.screen = pygame.display.set_mode((screen_size + width_boost, screen_size))
+        self.render_loop.call(resize_screen)
+        
+    def toggle_profiler_overlay(self) -> None:
+        def toggle_overlay() -> None:
+            self.profiler.is_overlay_visible = not self.profiler.is_overlay_visible
+            # Hidden overlay is covered only by redrawing whole screen.
+            self._last_frame = None
+        self.render_loop.call(toggle_overlay)
+        
+    def export_frame_timings(self) -> None:
+        path = self.profiler.export()
+        if path is not None:
+            print(f"Frame timings exported to: {path}.csv, {path}.json")
         
     def get_ground_block(self) -> voxels.GroundVoxel:
         return self.world.voxel_world[self.y][self.x]
@@ -439,108 +547,39 @@ class Player:
     def prepare_world_for_camera(self) -> RenderData:
         margins = self.calc_render_margins()
                
-        world_map = self.world.voxel_world[margins.top_index:margins.bottom_index+1]
         env_layer = self.world.env_layer[margins.top_index:margins.bottom_index+1]
-        for r_index, row in enumerate(world_map):
-            world_map[r_index] = row[margins.left_index:margins.right_index+1]
         for r_index, row in enumerate(env_layer):
             env_layer[r_index] = row[margins.left_index:margins.right_index+1]
             
         bullets = []
-        for bullet in self.bullets_manager.active_bullets:
-            if bullet.bullet_id in self.bullets_manager._remove:
-                continue
-            if bullet.x in range(margins.left_index, margins.right_index) and bullet.y in range(margins.top_index, margins.bottom_index):
-                bullet_data = BulletPayload("", bullet.color, bullet.x-margins.left_index, bullet.y-margins.top_index, bullet.direction)
-                bullets.append(bullet_data)
+        for bullet in self.bullets_manager.get_bullets(margins.left_index, margins.top_index, margins.right_index, margins.bottom_index):
+            bullet_data = BulletPayload(bullet.bullet_id, bullet.color, bullet.x-margins.left_index, bullet.y-margins.top_index, bullet.direction)
+            bullets.append(bullet_data)
                    
         enemies = []
-        for enemy in self.enemies.values():
-            if enemy.x in range(margins.left_index, margins.right_index) and enemy.y in range(margins.top_index, margins.bottom_index):
-                if not isinstance(self.world.env_layer[enemy.y][enemy.x], environment.Bush):
-                    enemy_data = Enemy(enemy.x-margins.left_index, enemy.y-margins.top_index, enemy.color, enemy.facing)
+        now = time.perf_counter()
+        for color, track in list(self.enemy_tracks.items()):
+            drawn = track.sample(now)
+            if drawn is None:
+                continue
+            
+            tile_x, tile_y = round(drawn.x), round(drawn.y)
+            if tile_x in range(margins.left_index, margins.right_index) and tile_y in range(margins.top_index, margins.bottom_index):
+                if not isinstance(self.world.env_layer[tile_y][tile_x], environment.Bush):
+                    enemy_data = Enemy(drawn.x-margins.left_index, drawn.y-margins.top_index, color, drawn.facing)
                     enemies.append(enemy_data)
                      
-        return RenderData(margins.left_append, margins.top_append, world_map, env_layer, bullets, enemies)
-        
-    def render(self, force: bool = False) -> None:
-        if self._redner_lock and not force:
-            return
-        self._redner_lock = True
+        return RenderData(margins.left_append, margins.top_append, margins, env_layer, bullets, enemies)
         
-        self.screen.fill((0, 0, 0))
-        render_data = self.prepare_world_for_camera()
-        if not self.is_started:
-            drop_shadow_text(self.screen, "Waiting...", self.screen.get_width() // 2 - 70, 300)
-            pygame.display.flip()
-            self._redner_lock = False
-            return
-        
-        # Ground layer.
-        y = render_data.y_offset
-        for y_index, world_row in enumerate(render_data.voxel_map):
-            x = render_data.x_offset
-            
-            for x_index, voxel in enumerate(world_row):
-                texture = voxel.get_texture(self.x+x, self.y+y)
-                img_rect = texture.get_rect().move(x*64, y*64)
-                self.screen.blit(texture, img_rect)
-                
-                # Rounded texture corners.
-                n_block = None
-                if y_index != 0:
-                    n_block = render_data.voxel_map[y_index-1][x_index]
-                       
-                e_block = None
-                if x_index != len(world_row)-1:
-                    e_block = render_data.voxel_map[y_index][x_index+1]
-                    
-                w_block = None
-                if x_index != 0:
-                    w_block = render_data.voxel_map[y_index][x_index-1]
-                    
-                s_block = None
-                if y_index != len(render_data.voxel_map)-1:
-                    s_block = render_data.voxel_map[y_index+1][x_index]
-                    
-                if w_block is not None and w_block == n_block:
-                    corner_texture = w_block.corner_texture
-                    if corner_texture:
-                        corner_texture = corner_texture.copy()
-                        corner_rect = corner_texture.get_rect().move(x*64, y*64)
-                        self.screen.blit(corner_texture, corner_rect)
-                
-                if n_block is not None and n_block == e_block:
-                    corner_texture = n_block.corner_texture
-                    if corner_texture:
-                        corner_texture = corner_texture.copy()
-                        corner_texture = pygame.transform.rotate(corner_texture, 270)
-                        corner_rect = corner_texture.get_rect().move(x*64, y*64)
-                        self.screen.blit(corner_texture, corner_rect)
-                    
-                if e_block is not None and e_block == s_block:
-                    corner_texture = e_block.corner_texture
-                    if corner_texture:
-                        corner_texture = corner_texture.copy()
-                        corner_texture = pygame.transform.rotate(corner_texture, 180)
-                        corner_rect = corner_texture.get_rect().move(x*64, y*64)
-                        self.screen.blit(corner_texture, corner_rect)
-                        
-                if s_block is not None and s_block == w_block:
-                    corner_texture = s_block.corner_texture
-                    if corner_texture:
-                        corner_texture = corner_texture.copy()
-                        corner_texture = pygame.transform.rotate(corner_texture, 90)
-                        corner_rect = corner_texture.get_rect().move(x*64, y*64)
-                        self.screen.blit(corner_texture, corner_rect)
-                
-                x += 1
-            y += 1
+    def collect_sprites(self, render_data: RenderData) -> list[tuple[pygame.Surface, pygame.Rect]]:
+        """ Textures drawn above the ground, in drawing order. """
+        sprites = []
         
         # Player.
         player_texture = self.get_player_texture()
         player_rect = player_texture.get_rect().move(self.visibility*64, self.visibility*64)
-        self.screen.blit(player_texture, player_rect)
+        sprites.append((player_texture, player_rect))
+        self.profiler.mark("player")
         
         # Environment layer.
         y = render_data.y_offset
@@ -556,86 +595,196 @@ class Player:
                 
                 if x == self.visibility and y == self.visibility:
                     if isinstance(env_voxel, environment.Bush):
-                        texture.set_alpha(100)
+                        texture = textures.get_alpha_variant(texture, 100)
                         
                 if texture:
                     img_rect = texture.get_rect().move(x*64, y*64)
-                    self.screen.blit(texture, img_rect)
+                    sprites.append((texture, img_rect))
                 else:
                     render_data.env_map[i][j] = None
 
                 x += 1
             y += 1
+        self.profiler.mark("env")
         
         # Enemies.
         for enemy_data in render_data.enemies:
-            enemy_texture = pygame.image.load(f"./textures/players/{enemy_data.color}.png").convert_alpha()
-            enemy_texture = pygame.transform.rotate(enemy_texture, -enemy_data.facing)
-
-            if self.world.voxel_world[self.enemies[enemy_data.color].y][self.enemies[enemy_data.color].x] == voxels.deep_water:
-                enemy_texture.set_alpha(140)
-            if self.world.voxel_world[self.enemies[enemy_data.color].y][self.enemies[enemy_data.color].x] == voxels.shallow_water:
-                enemy_texture.set_alpha(220)
+            enemy_x = round(enemy_data.x) + render_data.margins.left_index
+            enemy_y = round(enemy_data.y) + render_data.margins.top_index
+            alpha = get_water_alpha(self.world.voxel_world[enemy_y][enemy_x])
+            enemy_texture = textures.get_variant(textures.player_path(enemy_data.color), enemy_data.facing, alpha)
                 
             enemy_rect = enemy_texture.get_rect().move(
-                (enemy_data.x+render_data.x_offset)*64, 
-                (enemy_data.y+render_data.y_offset)*64
+                round((enemy_data.x+render_data.x_offset)*64), 
+                round((enemy_data.y+render_data.y_offset)*64)
             )
-            
-            self.screen.blit(enemy_texture, enemy_rect)
+            sprites.append((enemy_texture, enemy_rect))
+        self.profiler.mark("enemies")
 
         # Bullets.
         for bullet_data in render_data.bullets:
             bullet_data: BulletPayload
             
-            
-            bullet_image = pygame.image.load(f"./textures/bullets/bullet_{bullet_data.color}.png").convert_alpha()
-            bullet_image = pygame.transform.rotate(bullet_image, -bullet_data.direction)
+            bullet_image = textures.get_variant(textures.bullet_path(bullet_data.color), bullet_data.direction)
             
             bullet_rect = bullet_image.get_rect().move(
                 (bullet_data.shot_x+render_data.x_offset)*64, 
                 (bullet_data.shot_y+render_data.y_offset)*64
             )
+            sprites.append((bullet_image, bullet_rect))
+        self.profiler.mark("bullets")
+            
+        return sprites
     
-            self.screen.blit(bullet_image, bullet_rect)
+    def get_hud_state(self) -> tuple:
+        return (
+            self.health, 
+            self.visibility, 
+            f"{(self.walk_cooldown + self.slowness + self.speedness):.2}", 
+            self.walls_available, 
+            str(self.ammo_manager)
+        )
+        
+    def get_hud_rect(self) -> pygame.Rect:
+        return pygame.Rect(0, self.screen.get_height()-HUD_HEIGHT, self.screen.get_width(), HUD_HEIGHT)
+        
+    def get_frame_state(self, sprites: list[tuple[pygame.Surface, pygame.Rect]]) -> FrameState:
+        """ Textures covering each screen tile, used to find changed tiles between frames. """
+        tiles = {}
+        for texture, rect in sprites:
+            for tile_y in range(rect.top // 64, (rect.bottom-1) // 64 + 1):
+                for tile_x in range(rect.left // 64, (rect.right-1) // 64 + 1):
+                    tiles.setdefault((tile_x, tile_y), []).append((texture, rect.x, rect.y))
+                    
+        camera = (self.x, self.y, self.visibility, self.screen.get_size())
+        return FrameState(camera, tiles, self.get_hud_state())
+    
+    def find_dirty_regions(self, frame: FrameState) -> list[pygame.Rect] | None:
+        """ Screen regions changed since last frame, None if whole screen has to be redrawn. """
+        last_frame = self._last_frame
+        if last_frame is None or last_frame.camera != frame.camera:
+            return None
+        
+        regions = []
+        for tile in last_frame.tiles.keys() | frame.tiles.keys():
+            if last_frame.tiles.get(tile) != frame.tiles.get(tile):
+                regions.append(pygame.Rect(tile[0]*64, tile[1]*64, 64, 64))
+                
+        if last_frame.hud != frame.hud:
+            regions.append(self.get_hud_rect())
+        return regions
+        
+    def draw_region(self, region: pygame.Rect, sprites: list[tuple[pygame.Surface, pygame.Rect]]) -> None:
+        """ Draw all layers clipped to `region` of the screen. """
+        self.screen.set_clip(region)
+        self.screen.fill((0, 0, 0), region)
+        
+        # Ground layer (pre-rendered chunks with corners).
+        camera_left = self.x - self.visibility
+        camera_top = self.y - self.visibility
+        self.ground_cache.blit(
+            self.screen, 
+            camera_top + region.top // 64, camera_left + region.left // 64,
+            min(camera_top + (region.bottom-1) // 64, self.y + self.visibility), 
+            min(camera_left + (region.right-1) // 64, self.x + self.visibility),
+            -camera_left*64, -camera_top*64
+        )
+        self.profiler.mark("ground")
+        
+        # Player, environment layer, enemies and bullets.
+        for texture, rect in sprites:
+            if rect.colliderect(region):
+                self.screen.blit(texture, rect)
+        self.profiler.mark("sprites")
                    
         # God ray.
-        godray_image = pygame.image.load("./textures/godray.png").convert_alpha()
-        godray_image = pygame.transform.scale(godray_image, (self.screen.get_height()*1.2, self.screen.get_width()*1.2))
-        godray_image.set_alpha(220)
+        godray_size = (int(self.screen.get_height()*1.2), int(self.screen.get_width()*1.2))
+        godray_image = textures.get_scaled("./textures/godray.png", godray_size, 220)
         
         godray_rect = godray_image.get_rect()
         self.screen.blit(godray_image, godray_rect)
+        self.profiler.mark("godray")
+        
+        if region.colliderect(self.get_hud_rect()):
+            self.draw_interface()
+            self.profiler.mark("hud")
+            
+        self.screen.set_clip(None)
                     
-        # Interface.
+    def draw_interface(self) -> None:
         drop_shadow_text(self.screen, f"{self.health}", 40, self.screen.get_height()-40, color=(255, 200, 200), drop_color=(125, 0, 0))
-        heart_image = pygame.image.load("./textures/ui/heart.png").convert_alpha()
+        heart_image = textures.get("./textures/ui/heart.png")
         heart_rect = heart_image.get_rect().move(8, self.screen.get_height()-40)
         self.screen.blit(heart_image, heart_rect)
         
         drop_shadow_text(self.screen, f"{self.visibility}", 165, self.screen.get_height()-40, color=(200, 200, 255), drop_color=(0, 0, 125))
-        eye_image = pygame.image.load("./textures/ui/eye.png").convert_alpha()
+        eye_image = textures.get("./textures/ui/eye.png")
         eye_rect = eye_image.get_rect().move(130, self.screen.get_height()-40)
         self.screen.blit(eye_image, eye_rect)
         
         drop_shadow_text(self.screen, f"{(self.walk_cooldown + self.slowness + self.speedness):.2}", 270, self.screen.get_height()-40, color=(230, 217, 184), drop_color=(112, 90, 25))
-        boots_image = pygame.image.load("./textures/ui/speed.png").convert_alpha()
+        boots_image = textures.get("./textures/ui/speed.png")
         boots_rect = boots_image.get_rect().move(225, self.screen.get_height()-40)
         self.screen.blit(boots_image, boots_rect)
 
         drop_shadow_text(self.screen, f"{self.walls_available}", 420, self.screen.get_height()-40, color=(200, 140, 100), drop_color=(70, 40, 15))
-        shot_cooldown_image = pygame.image.load("./textures/ui/box.png").convert_alpha()
+        shot_cooldown_image = textures.get("./textures/ui/box.png")
         shot_cooldown_rect = shot_cooldown_image.get_rect().move(380, self.screen.get_height()-40)
         self.screen.blit(shot_cooldown_image, shot_cooldown_rect)
         
         drop_shadow_text(self.screen, str(self.ammo_manager), self.screen.get_width()-145, self.screen.get_height()-40)
-        ammo_image = pygame.image.load("./textures/ui/ammo.png").convert_alpha()
+        ammo_image = textures.get("./textures/ui/ammo.png")
         ammo_rect = ammo_image.get_rect().move(self.screen.get_width()-40, self.screen.get_height()-40)
         self.screen.blit(ammo_image, ammo_rect)
         
-        self._redner_lock = False
-        pygame.display.flip()
-        # pygame.display.update()
+    def render(self) -> None:
+        """ Request new frame, drawn by the render loop (safe to call from any thread). """
+        self.render_loop.invalidate()
+        
+    def draw_frame(self) -> None:
+        """ 
+        Draw current state, called only by the render loop. Only tiles and interface 
+        regions changed since last frame are redrawn and updated, unless camera moved.
+        """
+        if not self.is_started:
+            self.screen.fill((0, 0, 0))
+            drop_shadow_text(self.screen, "Waiting...", self.screen.get_width() // 2 - 70, 300)
+            pygame.display.flip()
+            self._last_frame = None
+            return
+        
+        self.profiler.begin_frame()
+        render_data = self.prepare_world_for_camera()
+        self.profiler.mark("camera")
+        sprites = self.collect_sprites(render_data)
+        frame = self.get_frame_state(sprites)
+        dirty_regions = self.find_dirty_regions(frame)
+        # Overlay is drawn above all layers, so its area is redrawn in every frame.
+        if dirty_regions is not None and self.profiler.is_overlay_visible:
+            dirty_regions.append(self.profiler.get_overlay_rect())
+        self.profiler.mark("diff")
+        
+        if dirty_regions is None:
+            self.draw_region(self.screen.get_rect(), sprites)
+            if self.profiler.is_overlay_visible:
+                self.profiler.draw_overlay(self.screen)
+                self.profiler.mark("overlay")
+            pygame.display.flip()
+        elif dirty_regions:
+            for region in dirty_regions:
+                self.draw_region(region, sprites)
+            if self.profiler.is_overlay_visible:
+                self.profiler.draw_overlay(self.screen)
+                self.profiler.mark("overlay")
+            pygame.display.update(dirty_regions)
+        self.profiler.mark("present")
+            
+        self._last_frame = frame
+        self.profiler.end_frame()
+        
+        # Moving enemies are drawn in every frame until they reach their newest state.
+        if self.is_enemy_animating():
+            self.render()
 
     def shoot(self) -> None:
         if self.get_ground_block() == voxels.deep_water:
@@ -652,15 +801,19 @@ class Player:
         bull_x = self.x
         bull_y = self.y
 
+        bullet_id = self._next_bullet_id
+        self._next_bullet_id = (bullet_id + 1) % codec.BULLET_ID_LIMIT
+
         bullet_data = BulletPayload(
-            uuid.uuid4().hex,
+            bullet_id,
             self.color,
             bull_x,
             bull_y,
             self.facing
         )
         
-        self.bullets_manager.add_bullet(bullet_data)   
+        if not self.server_bullets:
+            self.bullets_manager.add_bullet(bullet_data)
         self._next_shot_at = datetime.now() + timedelta(seconds=self.shoot_cooldown)
         self.send_event(headers.RENDER_BULLET, asdict(bullet_data))
 
@@ -686,10 +839,9 @@ class Player:
             if (wall_x, wall_y) == (enemy.x, enemy.y):
                 return
             
-        ground_voxel = self.world.voxel_world[wall_y][wall_x]
         env_voxel = self.world.env_layer[wall_y][wall_x]
         
-        if ground_voxel not in (voxels.snow, voxels.stone, voxels.deep_water):
+        if self.world.ground.can_build_on(wall_x, wall_y):
             if not isinstance(env_voxel, (environment.Tree, environment.Box)):
                 self.walls_available -= 1
                 self.world.env_layer[wall_y][wall_x] = environment.Box()
@@ -698,11 +850,18 @@ class Player:
                 self.send_env_update(wall_x, wall_y)              
         
     def input_handler(self):
+        """ Main loop: input is polled once per walk cooldown, frames are drawn meanwhile. """
         self.render()
+        next_input_at = 0
         
         while True:
             if self.exit_game:
                 return
+            
+            wait_time = next_input_at - time.perf_counter()
+            if wait_time > 0:
+                self.render_loop.run_pending(wait_time)
+                continue
                
             moved = False
             rotated = False
@@ -746,7 +905,11 @@ class Player:
                         self.ammo_manager.reload()
                     if event.key == pygame.K_e:
                         self.build_wall()
+                    if event.key == pygame.K_F3:
+                        self.toggle_profiler_overlay()
+                    if event.key == pygame.K_F4:
+                        self.export_frame_timings()
                         
-            time.sleep(self.walk_cooldown + self.slowness - self.speedness)
+            next_input_at = time.perf_counter() + self.walk_cooldown + self.slowness - self.speedness
                 
                         
\ No newline at end of file
@@ -0,0 +1,147 @@
+from dataclasses import dataclass, asdict
+from collections import deque
+import threading
+import datetime
+import pygame
+import json
+import time
+import csv
+import os
+
+# Frames kept for the overlay graph and exports.
+PROFILER_HISTORY = 3600
+# Phase averages are computed from this many last frames.
+AVERAGE_FRAMES = 60
+EXPORT_DIR = "./profiles"
+
+OVERLAY_POSITION = (8, 8)
+GRAPH_SIZE = (240, 64)
+BAR_WIDTH = 2
+GRAPH_MAX_MS = 33.3
+TARGET_FRAME_MS = 1000 / 60
+LINE_HEIGHT = 16
+FONT_SIZE = 14
+PHASE_COLORS = [
+    (230, 90, 90), (90, 200, 90), (90, 140, 230), (230, 200, 80), (200, 110, 220),
+    (80, 210, 210), (240, 150, 70), (170, 170, 170), (150, 230, 150), (250, 250, 250),
+]
+
+
+@dataclass
+class FrameTiming:
+    frame: int
+    time: float
+    total_ms: float
+    phases: dict[str, float]
+
+
+class FrameProfiler:
+    """
+    Per-phase timings of drawn frames. Frame is split into phases by `mark`
+    calls: time since the previous mark is added to the named phase, so phases
+    drawn more times per frame (e.g. dirty regions) are summed.
+    """
+    def __init__(self, history: int = PROFILER_HISTORY) -> None:
+        self.frames: deque[FrameTiming] = deque(maxlen=history)
+        self.is_overlay_visible = False
+        self.phase_names: list[str] = []
+        self._frame_index = 0
+        self._frame_started_at = 0.0
+        self._last_mark = 0.0
+        self._phases: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._font = None
+        self._background = None
+
+    def begin_frame(self) -> None:
+        self._frame_started_at = self._last_mark = time.perf_counter()
+        self._phases = {}
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self._phases[phase] = self._phases.get(phase, 0) + (now - self._last_mark) * 1000
+        self._last_mark = now
+
+    def end_frame(self) -> None:
+        total_ms = (time.perf_counter() - self._frame_started_at) * 1000
+        with self._lock:
+            for phase in self._phases:
+                if phase not in self.phase_names:
+                    self.phase_names.append(phase)
+            self.frames.append(FrameTiming(self._frame_index, time.time(), total_ms, self._phases))
+        self._frame_index += 1
+
+    def get_frames(self) -> list[FrameTiming]:
+        with self._lock:
+            return list(self.frames)
+
+    def phase_averages(self, frames: list[FrameTiming]) -> dict[str, float]:
+        """ Average milliseconds of every phase in `frames` (0 where phase was not drawn). """
+        if not frames:
+            return {}
+        return {
+            phase: sum(frame.phases.get(phase, 0) for frame in frames) / len(frames)
+            for phase in self.phase_names
+        }
+
+    def export(self, directory: str = EXPORT_DIR) -> str | None:
+        """ Write recorded frames as CSV and JSON, returns path without extension. """
+        frames = self.get_frames()
+        phase_names = list(self.phase_names)
+        path = os.path.join(directory, f"frames-{datetime.datetime.now():%Y%m%d-%H%M%S}")
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(path + ".csv", "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(["frame", "time", "total_ms", *phase_names])
+                for frame in frames:
+                    writer.writerow([
+                        frame.frame, f"{frame.time:.6f}", f"{frame.total_ms:.4f}",
+                        *[f"{frame.phases.get(phase, 0):.4f}" for phase in phase_names]
+                    ])
+
+            with open(path + ".json", "w") as file:
+                json.dump({"phases": phase_names, "frames": [asdict(frame) for frame in frames]}, file)
+        except OSError as error:
+            print(f"ERROR: Cannot export frame timings: {error}")
+            return None
+        return path
+
+    def get_overlay_rect(self) -> pygame.Rect:
+        height = GRAPH_SIZE[1] + LINE_HEIGHT * (len(self.phase_names) + 1) + 12
+        return pygame.Rect(OVERLAY_POSITION, (GRAPH_SIZE[0] + 8, height))
+
+    def draw_overlay(self, screen: pygame.Surface) -> pygame.Rect:
+        """ Frame time graph (newest on the right) and averages of phases, returns drawn rect. """
+        if self._font is None:
+            self._font = pygame.font.Font("./textures/ui/font.ttf", FONT_SIZE)
+
+        rect = self.get_overlay_rect()
+        if self._background is None or self._background.get_size() != rect.size:
+            self._background = pygame.Surface(rect.size, pygame.SRCALPHA)
+            self._background.fill((0, 0, 0, 170))
+        screen.blit(self._background, rect)
+
+        frames = self.get_frames()
+        graph_left, graph_bottom = rect.left + 4, rect.top + 4 + GRAPH_SIZE[1]
+        bars = GRAPH_SIZE[0] // BAR_WIDTH
+        for index, frame in enumerate(frames[-bars:]):
+            height = min(frame.total_ms / GRAPH_MAX_MS, 1) * GRAPH_SIZE[1]
+            color = (90, 200, 90) if frame.total_ms <= TARGET_FRAME_MS else (230, 90, 90)
+            pygame.draw.rect(screen, color, (graph_left + index * BAR_WIDTH, graph_bottom - height, BAR_WIDTH, height))
+
+        target_y = graph_bottom - TARGET_FRAME_MS / GRAPH_MAX_MS * GRAPH_SIZE[1]
+        pygame.draw.line(screen, (250, 250, 250), (graph_left, target_y), (graph_left + GRAPH_SIZE[0], target_y))
+
+        recent = frames[-AVERAGE_FRAMES:]
+        average_ms = sum(frame.total_ms for frame in recent) / len(recent) if recent else 0
+        lines = [(f"frame {average_ms:.2f} ms", (250, 250, 250))]
+        for index, (phase, phase_ms) in enumerate(self.phase_averages(recent).items()):
+            lines.append((f"{phase} {phase_ms:.2f} ms", PHASE_COLORS[index % len(PHASE_COLORS)]))
+
+        y = graph_bottom + 4
+        for text, color in lines:
+            screen.blit(self._font.render(text, True, color), (graph_left, y))
+            y += LINE_HEIGHT
+        return rect
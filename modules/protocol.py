@@ -0,0 +1,107 @@
+from modules import headers
+
+import struct
+import json
+
+# Frame: payload length (uint32), message type (uint8), payload.
+FRAME_HEADER = struct.Struct("!IB")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+MSG_JSON = 1
+MSG_BINARY = 2
+MSG_WORLD_SNAPSHOT = 3
+
+
+class ProtocolError(ConnectionError):
+    """ Stream does not contain valid frames, connection cannot be used anymore. """
+
+
+def encode_frame(msg_type: int, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload), msg_type) + payload
+
+
+def encode_json(header: str, payload: dict = {}) -> bytes:
+    data = {"EVENT": header, "PAYLOAD": payload}
+    return encode_frame(MSG_JSON, json.dumps(data).encode())
+
+
+def decode_json(payload: memoryview) -> dict:
+    return json.loads(bytes(payload))
+
+
+class FrameDecoder:
+    """
+    Incremental decoder of framed stream. Data is received directly into
+    reusable buffer and complete frames are returned as memoryviews of it,
+    these are valid only until next `recv_from` / `feed` call.
+    """
+    def __init__(self, bufsize: int = headers.CONN_BUFSIZE) -> None:
+        self._buffer = bytearray(bufsize)
+        self._start = 0
+        self._end = 0
+
+    def _make_space(self, needed: int) -> None:
+        """ Ensure at least `needed` free bytes after buffered data. """
+        buffered = self._end - self._start
+        if len(self._buffer) - self._end >= needed:
+            return
+
+        if len(self._buffer) - buffered >= needed:
+            self._buffer[:buffered] = self._buffer[self._start:self._end]
+        else:
+            # New buffer, views of the old one may still be alive.
+            new_buffer = bytearray(max(len(self._buffer) * 2, buffered + needed))
+            new_buffer[:buffered] = self._buffer[self._start:self._end]
+            self._buffer = new_buffer
+
+        self._start = 0
+        self._end = buffered
+
+    def _missing_bytes(self) -> int:
+        """ Bytes needed to complete currently buffered frame (at least 1). """
+        buffered = self._end - self._start
+        if buffered < FRAME_HEADER.size:
+            return FRAME_HEADER.size - buffered
+        length, _ = FRAME_HEADER.unpack_from(self._buffer, self._start)
+        return max(FRAME_HEADER.size + length - buffered, 1)
+
+    def recv_from(self, connection) -> bool:
+        """ Receive available data from socket, returns False when connection was closed. """
+        self._make_space(max(self._missing_bytes(), headers.CONN_BUFSIZE // 4))
+        with memoryview(self._buffer) as view:
+            received = connection.recv_into(view[self._end:])
+        self._end += received
+        return received > 0
+
+    def feed(self, data: bytes) -> None:
+        self._make_space(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def frames(self):
+        """ Yield all complete buffered frames as (message type, payload view). """
+        view = memoryview(self._buffer)
+
+        while self._end - self._start >= FRAME_HEADER.size:
+            length, msg_type = FRAME_HEADER.unpack_from(self._buffer, self._start)
+            if length > MAX_FRAME_SIZE:
+                raise ProtocolError(f"Frame too large: {length}")
+
+            payload_start = self._start + FRAME_HEADER.size
+            if self._end - payload_start < length:
+                break
+
+            self._start = payload_start + length
+            yield msg_type, view[payload_start:self._start]
+
+        if self._start == self._end:
+            self._start = self._end = 0
+
+
+def recv_frame(connection, decoder: FrameDecoder) -> tuple[int, bytes]:
+    """ Blocking receive of single frame (payload is copied). """
+    while True:
+        for msg_type, payload in decoder.frames():
+            return msg_type, bytes(payload)
+        if not decoder.recv_from(connection):
+            raise ProtocolError("Connection closed")
@@ -0,0 +1,115 @@
+from dataclasses import dataclass, asdict
+import threading
+import time
+
+DEFAULT_TARGET_FPS = 60
+
+
+@dataclass
+class FrameStats:
+    frames: int = 0
+    requests: int = 0
+    last_frame_ms: float = 0
+    avg_frame_ms: float = 0
+    max_frame_ms: float = 0
+    fps: float = 0
+
+    @property
+    def coalesced_requests(self) -> int:
+        """ Invalidate requests which did not need their own frame. """
+        return max(self.requests - self.frames, 0)
+
+
+class RenderLoop:
+    """
+    Frame requests from any thread (`invalidate`, or `call` for display operations
+    like `set_mode`) are coalesced into at most one frame per `1/target_fps` seconds.
+    Frames are drawn and presented only by `run_pending` on the main thread, as SDL
+    does not support display calls from other threads on every platform (macOS).
+    Pacing is a frame cap: `vsync` of `set_mode` applies only to SCALED / OPENGL
+    displays, so plain software surfaces are not vsync-aligned.
+    """
+    def __init__(self, draw_fn, target_fps: int = DEFAULT_TARGET_FPS) -> None:
+        self.draw_fn = draw_fn
+        self.target_fps = target_fps
+        self.stats = FrameStats()
+        self._condition = threading.Condition()
+        self._is_invalidated = False
+        self._tasks = []
+        self._next_frame_at = 0.0
+        self._fps_frames = 0
+        self._fps_started_at = time.perf_counter()
+
+    def invalidate(self) -> None:
+        """ Request new frame. """
+        with self._condition:
+            self._is_invalidated = True
+            self.stats.requests += 1
+            self._condition.notify()
+
+    def call(self, task) -> None:
+        """ Run `task` on the main thread before the next frame. """
+        with self._condition:
+            self._tasks.append(task)
+            self._is_invalidated = True
+            self._condition.notify()
+
+    def get_stats(self) -> dict:
+        return asdict(self.stats) | {"coalesced_requests": self.stats.coalesced_requests}
+
+    def run_pending(self, timeout: float) -> None:
+        """
+        Draw requested frames for up to `timeout` seconds (main thread only).
+        Requests arriving before the next frame is due are coalesced into it.
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            with self._condition:
+                while not self._is_invalidated:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        return
+                    self._condition.wait(remaining)
+
+            # Frame pacing.
+            now = time.perf_counter()
+            if self._next_frame_at > deadline:
+                time.sleep(max(deadline - now, 0))
+                return
+            if self._next_frame_at > now:
+                time.sleep(self._next_frame_at - now)
+            self._draw()
+
+    def _draw(self) -> None:
+        with self._condition:
+            self._is_invalidated = False
+            tasks, self._tasks = self._tasks, []
+
+        for task in tasks:
+            task()
+
+        frame_started_at = time.perf_counter()
+        try:
+            self.draw_fn()
+        except Exception as error:
+            print(f"ERROR: Cannot render frame: {error}")
+        self._record_frame(time.perf_counter() - frame_started_at)
+        self._next_frame_at = frame_started_at + 1 / self.target_fps
+
+    def _record_frame(self, frame_time: float) -> None:
+        frame_ms = frame_time * 1000
+        stats = self.stats
+        stats.frames += 1
+        stats.last_frame_ms = frame_ms
+        stats.max_frame_ms = max(stats.max_frame_ms, frame_ms)
+        if stats.frames == 1:
+            stats.avg_frame_ms = frame_ms
+        else:
+            stats.avg_frame_ms = stats.avg_frame_ms * 0.9 + frame_ms * 0.1
+
+        self._fps_frames += 1
+        now = time.perf_counter()
+        if now - self._fps_started_at >= 1:
+            stats.fps = self._fps_frames / (now - self._fps_started_at)
+            self._fps_frames = 0
+            self._fps_started_at = now
@@ -0,0 +1,124 @@
+from modules import environment
+from modules import chunks
+
+from dataclasses import dataclass
+import numpy as np
+import struct
+import zlib
+
+# Header: magic, version, height, width, seed, compressed grid size, stateful cells amount.
+SNAPSHOT_HEADER = struct.Struct("!4sBHHqII")
+SNAPSHOT_MAGIC = b"DSWS"
+SNAPSHOT_VERSION = 1
+COMPRESSION_LEVEL = 6
+
+# Env type id of a cell is its `environment.ENV_TYPES` index, 0 is an empty cell.
+ENV_TYPES = environment.ENV_TYPES
+ENV_TYPE_IDS = environment.ENV_TYPE_IDS
+
+# Attribute stored in the side table for stateful env voxels (single uint8 field of their schema).
+STATE_ATTRIBUTES = {
+    name: env_codec.fields[0]
+    for name, env_codec in environment.env_codecs.items() if env_codec.fields
+}
+STATE_TYPE_IDS = np.array([name in STATE_ATTRIBUTES for name in ENV_TYPES], dtype=np.bool_)
+STATE_DTYPE = np.dtype([("y", ">u2"), ("x", ">u2"), ("state", "u1")])
+
+
+class SnapshotError(ValueError):
+    """ Data is not a valid world snapshot of supported version. """
+
+
+@dataclass
+class WorldSnapshot:
+    height: int
+    width: int
+    seed: int
+    env_layer: environment.EnvLayer
+
+
+def env_layer_arrays(env_layer) -> tuple[np.ndarray, np.ndarray]:
+    """ Type ids and states of whole env layer, chunked layers are copied chunk by chunk. """
+    if isinstance(env_layer, environment.EnvLayer):
+        return env_layer.types.copy(), env_layer.states.copy()
+
+    if isinstance(env_layer, chunks.ChunkedLayer):
+        types = np.zeros((env_layer.height, env_layer.width), dtype=np.uint8)
+        cell_states = np.zeros((env_layer.height, env_layer.width), dtype=np.uint8)
+        chunk_size = env_layer.chunk_size
+        chunk_rows, chunk_cols = env_layer.chunks_shape()
+        for chunk_y in range(chunk_rows):
+            for chunk_x in range(chunk_cols):
+                chunk = env_layer.peek_chunk(chunk_y, chunk_x)
+                top, left = chunk_y * chunk_size, chunk_x * chunk_size
+                types[top:top + chunk.height, left:left + chunk.width] = chunk.types
+                cell_states[top:top + chunk.height, left:left + chunk.width] = chunk.states
+        return types, cell_states
+
+    env_layer = environment.EnvLayer.from_rows(env_layer)
+    return env_layer.types, env_layer.states
+
+
+def encode_env_grid(env_layer) -> tuple[np.ndarray, np.ndarray]:
+    """ Env type ids (uint8 grid) and side table of stateful cells. """
+    grid, cell_states = env_layer_arrays(env_layer)
+
+    state_ys, state_xs = np.nonzero(STATE_TYPE_IDS[grid])
+    states = np.zeros(len(state_ys), dtype=STATE_DTYPE)
+    states["y"] = state_ys
+    states["x"] = state_xs
+    states["state"] = cell_states[state_ys, state_xs]
+    return grid, states
+
+
+def decode_env_grid(grid: np.ndarray, states: np.ndarray) -> environment.EnvLayer:
+    height, width = grid.shape
+    cell_states = np.zeros((height, width), dtype=np.uint8)
+    cell_states[states["y"], states["x"]] = states["state"]
+    return environment.EnvLayer(height, width, grid.copy(), cell_states)
+
+
+def encode(world) -> bytes:
+    grid, states = encode_env_grid(world.env_layer)
+    compressed_grid = zlib.compress(grid.tobytes(), COMPRESSION_LEVEL)
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, world.height, world.width,
+        world.seed, len(compressed_grid), len(states)
+    )
+    return header + compressed_grid + states.tobytes()
+
+
+def decode(data: bytes) -> WorldSnapshot:
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise SnapshotError("Snapshot is too short")
+
+    magic, version, height, width, seed, grid_size, states_count = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError("Invalid snapshot magic")
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version: {version}")
+
+    states_start = SNAPSHOT_HEADER.size + grid_size
+    if len(data) != states_start + states_count * STATE_DTYPE.itemsize:
+        raise SnapshotError("Invalid snapshot size")
+
+    try:
+        grid_data = zlib.decompress(data[SNAPSHOT_HEADER.size:states_start])
+    except zlib.error as error:
+        raise SnapshotError(f"Cannot decompress env grid: {error}")
+    if len(grid_data) != height * width:
+        raise SnapshotError("Invalid env grid size")
+
+    grid = np.frombuffer(grid_data, dtype=np.uint8).reshape(height, width)
+    if grid.max(initial=0) >= len(ENV_TYPES):
+        raise SnapshotError("Unknown env type in snapshot")
+    states = np.frombuffer(data, dtype=STATE_DTYPE, count=states_count, offset=states_start)
+    if states_count and (
+        (states["y"] >= height).any() or (states["x"] >= width).any()
+        or not STATE_TYPE_IDS[grid[np.minimum(states["y"], height - 1), np.minimum(states["x"], width - 1)]].all()
+    ):
+        raise SnapshotError("Invalid stateful cells in snapshot")
+    if np.count_nonzero(STATE_TYPE_IDS[grid]) != len(np.unique(states[["y", "x"]])):
+        raise SnapshotError("Missing state of stateful cells in snapshot")
+
+    return WorldSnapshot(height, width, seed, decode_env_grid(grid, states))
@@ -0,0 +1,61 @@
+GRID_CELL_SIZE = 16
+
+
+class SpatialGrid:
+    """
+    Uniform grid index of keyed points (e.g. players by color). Queries check only
+    grid cells overlapping the queried square instead of all points.
+    """
+    def __init__(self, cell_size: int = GRID_CELL_SIZE) -> None:
+        self.cell_size = cell_size
+        self._cells: dict[tuple[int, int], set] = {}
+        self._positions: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, key) -> bool:
+        return key in self._positions
+
+    def _cell_of(self, x: int, y: int) -> tuple[int, int]:
+        return (x // self.cell_size, y // self.cell_size)
+
+    def position(self, key) -> tuple[int, int] | None:
+        return self._positions.get(key)
+
+    def update(self, key, x: int, y: int) -> None:
+        old_position = self._positions.get(key)
+        if old_position is not None:
+            old_cell = self._cell_of(*old_position)
+            if old_cell == self._cell_of(x, y):
+                self._positions[key] = (x, y)
+                return
+            self._discard_from_cell(old_cell, key)
+
+        self._positions[key] = (x, y)
+        self._cells.setdefault(self._cell_of(x, y), set()).add(key)
+
+    def remove(self, key) -> None:
+        position = self._positions.pop(key, None)
+        if position is not None:
+            self._discard_from_cell(self._cell_of(*position), key)
+
+    def _discard_from_cell(self, cell: tuple[int, int], key) -> None:
+        keys = self._cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self._cells[cell]
+
+    def query(self, x: int, y: int, radius: int) -> set:
+        """ Keys of points in square of `radius` (Chebyshev distance) around `x`, `y`. """
+        left_cell, top_cell = self._cell_of(x - radius, y - radius)
+        right_cell, bottom_cell = self._cell_of(x + radius, y + radius)
+
+        found = set()
+        for cell_y in range(top_cell, bottom_cell + 1):
+            for cell_x in range(left_cell, right_cell + 1):
+                for key in self._cells.get((cell_x, cell_y), ()):
+                    key_x, key_y = self._positions[key]
+                    if abs(key_x - x) <= radius and abs(key_y - y) <= radius:
+                        found.add(key)
+        return found
@@ -0,0 +1,102 @@
+from modules import directions
+
+import pygame
+
+PLAYER_COLORS = ["red", "blue", "orange"]
+ANGLES = [
+    directions.AngleDirection.N, directions.AngleDirection.NE,
+    directions.AngleDirection.E, directions.AngleDirection.SE,
+    directions.AngleDirection.S, directions.AngleDirection.SW,
+    directions.AngleDirection.W, directions.AngleDirection.NW,
+]
+# Alpha of sprites standing in: shallow water, deep water.
+WATER_ALPHAS = [220, 140]
+
+_textures: dict[str, pygame.Surface] = {}
+_variants: dict[tuple, pygame.Surface] = {}
+
+
+def get(path: str) -> pygame.Surface:
+    """
+    Texture loaded and converted only once.
+    Returned surface is shared, use `get_variant` instead of modifying it.
+    """
+    texture = _textures.get(path)
+    if texture is None:
+        texture = pygame.image.load(path).convert_alpha()
+        _textures[path] = texture
+    return texture
+
+
+def get_variant(path: str, angle: int = 0, alpha: int | None = None) -> pygame.Surface:
+    """ Texture rotated by `angle` (clockwise, as facing) with `alpha`, created only once. """
+    key = (path, angle, alpha)
+    variant = _variants.get(key)
+    if variant is None:
+        variant = get(path)
+        if angle:
+            variant = pygame.transform.rotate(variant, -angle)
+        if alpha is not None:
+            if not angle:
+                variant = variant.copy()
+            variant.set_alpha(alpha)
+        _variants[key] = variant
+    return variant
+
+
+def get_alpha_variant(texture: pygame.Surface, alpha: int) -> pygame.Surface:
+    """ Copy of already loaded `texture` with `alpha`, created only once. """
+    key = (texture, alpha)
+    variant = _variants.get(key)
+    if variant is None:
+        variant = texture.copy()
+        variant.set_alpha(alpha)
+        _variants[key] = variant
+    return variant
+
+
+def get_scaled(path: str, size: tuple[int, int], alpha: int | None = None) -> pygame.Surface:
+    key = (path, "scaled", size, alpha)
+    variant = _variants.get(key)
+    if variant is None:
+        variant = pygame.transform.scale(get(path), size)
+        if alpha is not None:
+            variant.set_alpha(alpha)
+        _variants[key] = variant
+    return variant
+
+
+def player_path(color: str) -> str:
+    return f"./textures/players/{color}.png"
+
+
+def bullet_path(color: str) -> str:
+    return f"./textures/bullets/bullet_{color}.png"
+
+
+def preload() -> None:
+    """ Load all sprites and their rotated and water variants. Requires display mode to be set. """
+    for path in [
+        "./textures/godray.png",
+        "./textures/ui/heart.png",
+        "./textures/ui/eye.png",
+        "./textures/ui/speed.png",
+        "./textures/ui/box.png",
+        "./textures/ui/ammo.png",
+        "./textures/env/bush.png",
+        "./textures/collectables/ammobox.png",
+        "./textures/collectables/healthbox.png",
+        "./textures/collectables/vis_boost.png",
+        "./textures/collectables/speed_boost.png",
+        "./textures/collectables/add_box.png",
+        *(f"./textures/env/tree/tree-{index}.png" for index in range(1, 4)),
+        *(f"./textures/env/cactus/cactus{index}.png" for index in range(1, 10)),
+        *(f"./textures/box/box{index}.png" for index in range(1, 6)),
+    ]:
+        get(path)
+
+    for color in PLAYER_COLORS:
+        for angle in ANGLES:
+            for alpha in [None, *WATER_ALPHAS]:
+                get_variant(player_path(color), angle, alpha)
+                get_variant(bullet_path(color), angle, alpha)
@@ -1,6 +1,7 @@
 from modules import helpers
+from modules import perlin
 
-import random
+import numpy as np
 import pygame
 
 default_grass = pygame.image.load("./textures/grass/grass2.png")
@@ -25,9 +26,13 @@ sand_textures = [
 
 
 class GroundVoxel:
-    def __init__(self, name: str, on_stand_slowness: float = 0, all_textures: list = None, no_corner: bool = False):
+    def __init__(self, name: str, on_stand_slowness: float = 0, all_textures: list = None, no_corner: bool = False,
+                 walkable: bool = True, blocks_bullets: bool = False, can_build_on: bool = True):
         self.name = name
         self.voxel_slowness = on_stand_slowness
+        self.walkable = walkable
+        self.blocks_bullets = blocks_bullets
+        self.can_build_on = can_build_on
         self.basic_texture = None
         self.corner_texture = None
         if not no_corner:
@@ -35,31 +40,46 @@ class GroundVoxel:
         
         self.has_random_textures = all_textures is not None
         self.all_random_textures = all_textures
-        self._txt_cache = {}
         
         if not self.has_random_textures:
             self.basic_texture = pygame.image.load(f"./textures/{name}.png")
         
         
-    def get_texture(self, x: int, y: int) -> pygame.Surface:
+    def get_texture(self, variant: int = 0) -> pygame.Surface:
+        """ `variant` is cell's value of `World.texture_variants`. """
         if not self.has_random_textures:
             return self.basic_texture
+        return self.all_random_textures[variant % len(self.all_random_textures)]
 
-        cache_key = f"{x}.{y}"
-        if cache_key in self._txt_cache:
-            return self.all_random_textures[self._txt_cache[cache_key]]
         
-        cache_value = random.randint(0, len(self.all_random_textures)-1)
-        self._txt_cache[cache_key] = cache_value
-        return self.all_random_textures[cache_value]
-
-        
-deep_water = GroundVoxel("deep_water", 0.5, no_corner=True)
+deep_water = GroundVoxel("deep_water", 0.5, no_corner=True, can_build_on=False)
 shallow_water = GroundVoxel("shallow_water", 0.2)
 grass = GroundVoxel("grass", all_textures=grass_images)
 sand = GroundVoxel("sand", 0.05, all_textures=sand_textures)
-stone = GroundVoxel("stone")
-snow = GroundVoxel("snow", 0.1, no_corner=True)
+stone = GroundVoxel("stone", walkable=False, blocks_bullets=True, can_build_on=False)
+snow = GroundVoxel("snow", 0.1, no_corner=True, walkable=False, blocks_bullets=True, can_build_on=False)
+
+# Index in this list is the voxel id stored in ground layers and cached maps.
+voxel_registry = [deep_water, shallow_water, sand, grass, stone, snow]
+voxel_ids = {voxel: voxel_id for voxel_id, voxel in enumerate(voxel_registry)}
+
+# Per-id property tables, index them with single id or whole id array.
+VOXEL_SLOWNESS = np.array([voxel.voxel_slowness for voxel in voxel_registry], dtype=np.float64)
+VOXEL_WALKABLE = np.array([voxel.walkable for voxel in voxel_registry], dtype=np.bool_)
+VOXEL_BLOCKS_BULLETS = np.array([voxel.blocks_bullets for voxel in voxel_registry], dtype=np.bool_)
+VOXEL_CAN_BUILD_ON = np.array([voxel.can_build_on for voxel in voxel_registry], dtype=np.bool_)
+# Texture variants are drawn from this range, a multiple of every voxel's textures amount,
+# so `variant % len(all_random_textures)` picks each texture with the same chance.
+TEXTURE_VARIANT_RANGE = int(np.lcm.reduce([len(voxel.all_random_textures) for voxel in voxel_registry if voxel.has_random_textures]))
+
+
+def generate_texture_variants(rows: int, cols: int, rng: np.random.Generator) -> np.ndarray:
+    """ Texture variant (see `GroundVoxel.get_texture`) of every cell as uint8 grid. """
+    return rng.integers(0, TEXTURE_VARIANT_RANGE, size=(rows, cols), dtype=np.uint8)
+
+
+# Bump when generation_map changes, invalidates cached maps.
+GENERATION_VERSION = 1
 
 generation_map = {
     helpers.FloatRange(-0.6, -0.35): deep_water,
@@ -71,10 +91,108 @@ generation_map = {
 }    
 
 
-def voxel_from_perlin(value: float) -> GroundVoxel:
+def _classify(value: float) -> GroundVoxel:
     for gen_range, voxel in generation_map.items():
         if value in gen_range:
             return voxel
 
-    return value
 
+# Ground voxel id of every normalized perlin value (see `perlin.lut_index`).
+GROUND_LUT = np.array([voxel_ids[_classify(value)] for value in perlin.lut_values()], dtype=np.uint8)
+
+
+def voxel_from_perlin(value: float) -> GroundVoxel:
+    return voxel_registry[GROUND_LUT[perlin.lut_index(value)]]
+
+
+def generate_ground_ids(perlin_map) -> np.ndarray:
+    """ Ground voxel ids of whole (normalized) perlin map in one lookup. """
+    return GROUND_LUT[perlin.lut_index(perlin_map)]
+
+
+class GroundRow:
+    """ Row of `GroundLayer`, indexing returns `GroundVoxel` objects. """
+    def __init__(self, ids) -> None:
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        for voxel_id in self.ids:
+            yield voxel_registry[voxel_id]
+
+    def __getitem__(self, x):
+        if isinstance(x, slice):
+            return [voxel_registry[voxel_id] for voxel_id in self.ids[x]]
+        return voxel_registry[self.ids[x]]
+
+    def __setitem__(self, x: int, voxel: GroundVoxel) -> None:
+        self.ids[x] = voxel_ids[voxel]
+
+
+class GroundLayer:
+    """
+    Ground layer stored as uint8 voxel ids (see `voxel_registry`).
+    `ids` is a numpy array (or `chunks.ChunkedLayer` of uint8 chunks for chunked worlds).
+    `layer[y][x]` still returns `GroundVoxel`, rows and columns are views of `ids`
+    (columns of chunked ids are copies).
+    """
+    def __init__(self, ids) -> None:
+        self.ids = ids
+        self.height = len(ids)
+        self.width = len(ids[0]) if self.height else 0
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield GroundRow(self.ids[y])
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return voxel_registry[self.ids[key]]
+        if isinstance(key, slice):
+            return [GroundRow(self.ids[y]) for y in range(*key.indices(self.height))]
+        return GroundRow(self.ids[key])
+
+    def row(self, y: int):
+        return self.ids[y]
+
+    def column(self, x: int):
+        if isinstance(self.ids, np.ndarray):
+            return self.ids[:, x]
+        return np.array(self.ids.column(x), dtype=np.uint8)
+
+    def get_id(self, x: int, y: int) -> int:
+        return int(self.ids[y, x])
+
+    def set(self, x: int, y: int, voxel: GroundVoxel) -> None:
+        self.ids[y, x] = voxel_ids[voxel]
+
+    def slowness(self, x: int, y: int) -> float:
+        return float(VOXEL_SLOWNESS[self.ids[y, x]])
+
+    def is_walkable(self, x: int, y: int) -> bool:
+        return bool(VOXEL_WALKABLE[self.ids[y, x]])
+
+    def blocks_bullets(self, x: int, y: int) -> bool:
+        return bool(VOXEL_BLOCKS_BULLETS[self.ids[y, x]])
+
+    def blocks_bullets_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """ `blocks_bullets` of many cells at once. """
+        if isinstance(self.ids, np.ndarray):
+            return VOXEL_BLOCKS_BULLETS[self.ids[ys, xs]]
+        return np.array([self.blocks_bullets(x, y) for x, y in zip(xs.tolist(), ys.tolist())], dtype=np.bool_)
+
+    def can_build_on(self, x: int, y: int) -> bool:
+        return bool(VOXEL_CAN_BUILD_ON[self.ids[y, x]])
+
+    def walkable_mask(self) -> np.ndarray:
+        """ Whole map query, only for array backed layers. """
+        return VOXEL_WALKABLE[self.ids]
+
+    def blocks_bullets_mask(self) -> np.ndarray:
+        """ Whole map query, only for array backed layers. """
+        return VOXEL_BLOCKS_BULLETS[self.ids]
@@ -1,77 +1,104 @@
 from modules import collectables
 from modules import environment
+from modules import chunks
+from modules import map_cache
 from modules import perlin
+from modules import snapshot
 from modules import voxels
 
+import numpy as np
 import random
 
+# Maps with more cells than CHUNKED_MIN_SIZE^2 are chunked by default.
+CHUNKED_MIN_SIZE = 256
+# Independent random streams of seeded generation (see `World._region_rng`).
+ENV_STREAM = 0
+TEXTURE_STREAM = 1
 
-def perctentage_random(chance: float) -> bool:
-    return random.random() < chance
 
+def load_ground_ids(height: int, width: int, seed: int) -> np.ndarray:
+    """ Ground voxel ids (see `voxels.voxel_registry`), cached on disk. """
+    def generate() -> np.ndarray:
+        return voxels.generate_ground_ids(perlin.generate_perlin_array(height, width, seed))
 
-def generate_voxel_world(perlin_map: list[list[float]]) -> list:
-    world = []
-    
-    for row in perlin_map:
-        world_row = []
-        
-        for perlin_value in row:
-            voxel = voxels.voxel_from_perlin(perlin_value)
-            world_row.append(voxel)
-            
-        world.append(world_row)
-        
-    return world
+    key = map_cache.cache_key("ground", perlin.GENERATOR_VERSION, voxels.GENERATION_VERSION, height, width, seed)
+    return map_cache.load_or_generate(key, generate)
+
+
+def load_env_perlin_map(height: int, width: int, seed: int, octaves: float) -> np.ndarray:
+    """ Perlin map used for environment generation, cached on disk. """
+    key = map_cache.cache_key("env_perlin", perlin.GENERATOR_VERSION, height, width, seed, octaves)
+    return map_cache.load_or_generate(key, lambda: perlin.generate_perlin_array(height, width, seed, octaves))
 
 
-def generate_env_layer(world_map, env_map) -> list:
-    env_layer = []
+def generate_env_layer(ground_ids: np.ndarray, env_map: np.ndarray, rng: np.random.Generator) -> environment.EnvLayer:
+    """
+    Whole env layer in a few vectorized passes: env kinds are looked up from
+    perlin values, collectables are spawned on cells without env kind with
+    random masks (each collectable is tried in order with its spawn chance).
+    """
+    ground_ids = np.asarray(ground_ids, dtype=np.intp)
+    generated_types = environment.ENV_TYPE_LUT[perlin.lut_index(env_map)]
     
-    for y, row in enumerate(env_map):
-        env_layer_row = []
+    types = np.where(environment.ENV_SPAWN_MASK[generated_types, ground_ids], generated_types, 0).astype(np.uint8)
+    states = np.zeros(types.shape, dtype=np.uint8)
+    for name, voxel_type in environment.env_voxel_types.items():
+        if not hasattr(voxel_type, "GENERATED_RANGE"):
+            continue
+        is_kind = types == environment.ENV_TYPE_IDS[name]
+        min_state, max_state = voxel_type.GENERATED_RANGE
+        states[is_kind] = rng.integers(min_state, max_state + 1, size=np.count_nonzero(is_kind))
         
-        for x, perlin_value in enumerate(row):
-            env_voxel = environment.env_voxel_from_perlin(perlin_value)
-            if env_voxel is None:
-                added_collectable = False
-                for collectable in collectables.all_collectables:
-                    if perctentage_random(collectable.spawn_chance):
-                        if world_map[y][x] in collectable.spawn_on:
-                            env_layer_row.append(collectable)
-                            added_collectable = True
-                            break
-                    
-                if added_collectable:
-                    continue
-            
-            if env_voxel is not None:
-                ground_voxel = world_map[y][x]
-                if env_voxel.can_stand_on and ground_voxel in env_voxel.can_stand_on:
-                    env_layer_row.append(env_voxel)
-                    continue
-                        
-            env_layer_row.append(None)
-        env_layer.append(env_layer_row)
+    is_free = generated_types == 0
+    for collectable in collectables.all_collectables:
+        type_id = environment.ENV_TYPE_IDS[collectable.name]
+        is_drawn = is_free & (rng.random(types.shape) < collectable.spawn_chance)
+        types[is_drawn & environment.ENV_SPAWN_MASK[type_id, ground_ids]] = type_id
+        is_free &= ~is_drawn
         
-    return env_layer
+    return environment.EnvLayer(types.shape[0], types.shape[1], types, states)
 
 
 class World:
-    def __init__(self, height: int = 100, width: int = 100, seed: int = 10, override_env: list = None) -> None:
+    def __init__(self, height: int = 100, width: int = 100, seed: int = 10, override_env: list = None, chunked: bool = None, env_layer: list = None) -> None:
+        """
+        With `chunked` the ground and env layers are generated lazily in chunks
+        (see `chunks.ChunkedLayer`), so only visited parts of big maps are stored.
+        By default only big maps are chunked.
+        `env_layer` is used as it is instead of generating one (see `from_snapshot`).
+        """
         self.height = height
         self.width = width
         self.seed = seed
+        if chunked is None:
+            chunked = height * width > CHUNKED_MIN_SIZE ** 2
+        self.chunked = chunked
+        
+        if chunked:
+            self.ground_ids = chunks.ChunkedLayer(self.height, self.width, self._generate_ground_chunk)
+        else:
+            self.ground_ids = load_ground_ids(self.height, self.width, self.seed)
+        self.ground = voxels.GroundLayer(self.ground_ids)
+        self.voxel_world = self.ground
         
-        self.world_perlin_map = perlin.generate_perlin_map(self.height, self.width, self.seed)
-        self.voxel_world = generate_voxel_world(self.world_perlin_map)
+        # Same for all clients, as it depends only on the seed.
+        if chunked:
+            self.texture_variants = chunks.ChunkedLayer(self.height, self.width, self._generate_texture_variants_chunk)
+        else:
+            self.texture_variants = self._generate_texture_variants_chunk(0, 0, self.height, self.width)
+        
+        if env_layer is not None:
+            self.env_layer = env_layer
         
-        self.env_perlin_map = perlin.generate_perlin_map(self.height, self.width, self.seed, 0.15*height)
-        if override_env is None:
-            self.env_layer = generate_env_layer(self.voxel_world, self.env_perlin_map)
+        elif override_env is None and chunked:
+            self.env_layer = chunks.ChunkedLayer(self.height, self.width, self._generate_env_chunk)
+            
+        elif override_env is None:
+            env_perlin_map = load_env_perlin_map(self.height, self.width, self.seed, 0.15*height)
+            self.env_layer = generate_env_layer(self.ground_ids, env_perlin_map, self._region_rng(ENV_STREAM, 0, 0))
         
         else:
-            self.env_layer = []
+            env_rows = []
             
             input_translation_table = {
                 "tree": environment.Tree,
@@ -99,16 +126,52 @@ class World:
                     
                     env_obj = input_translation_table[item]()
                     env_row.append(env_obj)
-                self.env_layer.append(env_row)
+                env_rows.append(env_row)
+            self.env_layer = environment.EnvLayer.from_rows(env_rows)
+        
+    def _generate_ground_chunk(self, top: int, left: int, rows: int, cols: int) -> np.ndarray:
+        perlin_map = perlin.generate_perlin_array(self.height, self.width, self.seed, 10, top, left, rows, cols)
+        return voxels.generate_ground_ids(perlin_map)
+    
+    def _generate_env_chunk(self, top: int, left: int, rows: int, cols: int) -> environment.EnvLayer:
+        chunk_size = self.ground_ids.chunk_size
+        ground_chunk = self.ground_ids.get_chunk(top // chunk_size, left // chunk_size)[:rows, :cols]
+        perlin_map = perlin.generate_perlin_array(self.height, self.width, self.seed, 0.15*self.height, top, left, rows, cols)
+        return generate_env_layer(ground_chunk, perlin_map, self._region_rng(ENV_STREAM, top, left))
+    
+    def _generate_texture_variants_chunk(self, top: int, left: int, rows: int, cols: int) -> np.ndarray:
+        return voxels.generate_texture_variants(rows, cols, self._region_rng(TEXTURE_STREAM, top, left))
+    
+    def _region_rng(self, stream: int, top: int, left: int) -> np.random.Generator:
+        """ Seeded per map region, so unloaded chunk is generated again with the same content. """
+        return np.random.default_rng([self.seed % 2**64, stream, top, left])
         
     def get_spawn_point(self) -> tuple[int, int]:
         # return (random.randint(5, 10), random.randint(5, 10))
-        x = random.randint(5, self.width-5)
-        y = random.randint(5, self.height-5)
+        if isinstance(self.ground_ids, np.ndarray):
+            # All walkable cells of the spawn area in one vectorized query.
+            walkable_ys, walkable_xs = np.nonzero(self.ground.walkable_mask()[5:self.height-4, 5:self.width-4])
+        
         while True:
-            if self.voxel_world[y][x] not in (voxels.stone, voxels.snow):
-                if not isinstance(self.env_layer[y][x], (environment.Tree, environment.Cactus)):
-                    return (y, x)
+            if isinstance(self.ground_ids, np.ndarray):
+                index = random.randrange(len(walkable_ys))
+                x, y = int(walkable_xs[index]) + 5, int(walkable_ys[index]) + 5
+            else:
+                x = random.randint(5, self.width-5)
+                y = random.randint(5, self.height-5)
+                if not self.ground.is_walkable(x, y):
+                    continue
+                
+            if not isinstance(self.env_layer[y][x], (environment.Tree, environment.Cactus)):
+                return (y, x)
+        
+    @classmethod
+    def from_snapshot(cls, world_snapshot: snapshot.WorldSnapshot) -> "World":
+        return cls(world_snapshot.height, world_snapshot.width, world_snapshot.seed, env_layer=world_snapshot.env_layer)
+        
+    def to_snapshot(self) -> bytes:
+        """ Binary env state sent to clients (see `snapshot.encode`). """
+        return snapshot.encode(self)
         
     def to_dict(self) -> dict:
         env_data = []
@@ -1,204 +1,172 @@
-from modules import headers
-from modules import world
+from modules import metrics
+from modules import match
 
-import threading
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import asyncio
 import socket
-import random
-import json
-import time
 import sys
 import os
 
 
-os.system("cls || clear")
-
 PLAYERS_AMOUNT = 2
 if len(sys.argv) > 1:
     try:
         PLAYERS_AMOUNT = int(sys.argv[1])
     except ValueError:
         print(f"ERROR: Invalid custom PLAYERS_AMOUNT: {PLAYERS_AMOUNT} (using 2)")
-print(f"Awaiting {PLAYERS_AMOUNT} players...")
-
-PLAYER_COLORS = ["red", "blue", "orange"]
-color_pointer = -1
-def get_player_color() -> str:
-    global color_pointer
-    color_pointer += 1
-    if color_pointer > len(PLAYER_COLORS)-1:
-        color_pointer = 0
-    return PLAYER_COLORS[color_pointer]
+if PLAYERS_AMOUNT > len(match.PLAYER_COLORS):
+    print(f"ERROR: Too many players per match: {PLAYERS_AMOUNT} (using {len(match.PLAYER_COLORS)})")
+    PLAYERS_AMOUNT = len(match.PLAYER_COLORS)
 
-is_game_started = False
+WORLD_SIZE = 100
+if len(sys.argv) > 2:
+    try:
+        WORLD_SIZE = int(sys.argv[2])
+    except ValueError:
+        print(f"ERROR: Invalid custom WORLD_SIZE: {sys.argv[2]} (using 100)")
 
+# Enemy states and bullets are sent aggregated TICK_RATE times per second (0: immediately).
+TICK_RATE = 0
+if len(sys.argv) > 3:
+    try:
+        TICK_RATE = float(sys.argv[3])
+    except ValueError:
+        print(f"ERROR: Invalid custom TICK_RATE: {sys.argv[3]} (using 0)")
 
-def is_game_over() -> bool:
-    if not is_game_started:
-        return False
-    return len(ClientHandler.active_clients) <= 1
-
-def get_winner() -> str:
-    if not is_game_over():
-        return ""
-    if ClientHandler.active_clients:
-        return list(ClientHandler.active_clients.keys())[0].title()
-    return ""
-
-
-class ClientHandler:
-    active_clients: dict[str, "ClientHandler"] = {}
-    
-    @staticmethod
-    def spread_message(header: str, message: dict = {}) -> None:
-        """ Send message to all active clients. """
-        for client in ClientHandler.active_clients.values():
-            client.send_to_client(header, message)
-    
-    @staticmethod
-    def remove_client(color: str) -> None:
-        if color in ClientHandler.active_clients:
-            ClientHandler.active_clients.pop(color)
-        
-        ClientHandler.spread_message(headers.DESTROY_ENEMY, {"color": color})
-        if is_game_over():
-            print(f"\nWinner: {get_winner()}")
-            print("\n=== GAME OVER ===\n")
-            ClientHandler.spread_message(headers.GAME_OVER)
-    
-    def __init__(self, connection, address, world) -> None:
-        if ClientHandler.active_clients == len(PLAYER_COLORS):
-            print("! Refusing connection: max players")
-            return
-        if is_game_started:
-            print("! Refusing connection: game is started")
-            return
-        
-        self.connection = connection
-        self.address = address
-        self.color = get_player_color()
-        self.world = world
-        self.player_y, self.player_x = self.world.get_spawn_point()
-        self.is_ready = False
-        
-        self.receiver_th = threading.Thread(target=self.receiver, daemon=True)
-        self.receiver_th.start()
-        
-        print(f"* Registered {self.color} player!")
-        
-        self.send_to_client(headers.GAME_INIT_WORLD_DATA, self.world.to_dict())
-        time.sleep(0.25)
-        self.send_to_client(headers.GAME_INIT_PLAYER_DATA, {
-            "color": self.color,
-            "spawn_x": self.player_x,
-            "spawn_y": self.player_y
-        })
-        
-        ClientHandler.active_clients[self.color] = self
-        
-    def send_to_client(self, header: str, message: dict = {}) -> None:
-        data = {"EVENT": header, "PAYLOAD": message}
-        
-        try:
-            self.connection.send((json.dumps(data)+";").encode())
-        except ConnectionError:
-            print(f"ERROR: cannot send message to: {self.color}")
-            ClientHandler.remove_client(self.color)
-        
-    def receiver(self):
-        while True:
-            try:
-                msg = self.connection.recv(headers.CONN_BUFSIZE).decode()
-            except ConnectionError:
-                print(f"* {self.color}: Connection stopped.")
-                ClientHandler.remove_client(self.color)
-                return
+# Matches played at the same time, each one in its own process.
+MATCH_WORKERS = os.cpu_count() or 1
+if len(sys.argv) > 4:
+    try:
+        MATCH_WORKERS = int(sys.argv[4])
+    except ValueError:
+        print(f"ERROR: Invalid custom MATCH_WORKERS: {sys.argv[4]} (using {MATCH_WORKERS})")
 
-            for packet in msg.split(";"):
-                if packet:
-                    self.handle_message(packet)
-
-    def handle_message(self, message: dict) -> None:
-        global is_game_started
-        
-        message = json.loads(message)
-        event_type = message.get("EVENT")
-        payload = message.get("PAYLOAD")
-        
-        if event_type == headers.CLIENT_READY:
-            print(f"{self.color}: Client is ready ({len(ClientHandler.active_clients)}/{PLAYERS_AMOUNT})")
-            self.is_ready = True
-            
-            if len(ClientHandler.active_clients) != PLAYERS_AMOUNT:
-                return
-            for client in ClientHandler.active_clients.values():
-                if not client.is_ready:
-                    return
-                            
-            # Start game.
-            ClientHandler.spread_message(headers.START_GAME)
-            is_game_started = True
-            print("\n=== GAME STARTED ===\n")
-
-        if event_type == headers.PLAYER_UPDATE:
-            self.player_x = payload.get("x")
-            self.player_y = payload.get("y")
-            
-            for color, client in ClientHandler.active_clients.items():
-                if color == self.color:
-                    continue
-                client.send_to_client(headers.ENEMY_UPDATE, payload)
-                
-        if event_type == headers.ENV_UPDATE:
-            ClientHandler.spread_message(headers.ENV_UPDATE, payload)
-
-        if event_type == headers.BULLET_HIT:
-            target = payload["target"]
-            if target not in ClientHandler.active_clients:
-                print(f"ERROR: Received bullet hit to unregistered enemy? {target}")
-                return
-            
-            ClientHandler.active_clients[target].send_to_client(headers.BULLET_HIT)
-            
-        if event_type == headers.DEATH:
-            color = payload["color"]
-            self.remove_client(color)
-            
-        if event_type == headers.RENDER_BULLET:
-            color = payload["color"]
-            for color, client in ClientHandler.active_clients.items():
-                if color == self.color:
-                    continue
-                client.send_to_client(headers.RENDER_BULLET, payload)
+# Bullets simulated once by the server instead of by every client (0/1).
+BULLET_SIMULATION = False
+if len(sys.argv) > 5:
+    BULLET_SIMULATION = sys.argv[5] == "1"
 
+# Local HTTP port of Prometheus metrics endpoint, metrics are also dumped to `metrics.DUMP_PATH` (0: disabled).
+METRICS_PORT = 0
+if len(sys.argv) > 6:
+    try:
+        METRICS_PORT = int(sys.argv[6])
+    except ValueError:
+        print(f"ERROR: Invalid custom METRICS_PORT: {sys.argv[6]} (using 0)")
 
 PORT = 5050
 SERVER = socket.gethostbyname(socket.gethostname())
 ADDRESS = (SERVER, PORT)
 
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server.bind(ADDRESS)
-
-
-def connection_accepter(public_world):
-    server.listen()
-    print(f"Server is listening on: {SERVER}:{PORT}\n")
-    
-    while True:
-        try:
-            conn, addr = server.accept()
-        except OSError:
-            return
-        ClientHandler(conn, addr, public_world)
-
-def start_server():
-    public_world = world.World(height=100, width=100, seed=random.randint(1, 1000))
-    conn_accepter = threading.Thread(target=connection_accepter, args=(public_world,), daemon=False)
-    conn_accepter.start()
-    
-    while not is_game_over():
-        pass
-    
-    server.close()        
-    
-
-start_server()
+
+def is_connected(connection: socket.socket) -> bool:
+    """ Peer did not close the (non-blocking) connection, pending data is not consumed. """
+    try:
+        return connection.recv(1, socket.MSG_PEEK) != b""
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+
+class Lobby:
+    """
+    Accepts all connections and groups them into matches of `PLAYERS_AMOUNT`
+    players. Matches are played in worker processes, the lobby stays up.
+    """
+    def __init__(self, pool: ProcessPoolExecutor, collector: metrics.MetricsCollector | None = None) -> None:
+        self.pool = pool
+        self.collector = collector
+        self.metrics = collector.lobby if collector is not None else metrics.DisabledMetrics()
+        self.waiting: list[socket.socket] = []
+        self.matches_count = 0
+        self.running_matches = 0
+
+    def add_connection(self, connection: socket.socket, address) -> None:
+        self.drop_closed_connections()
+        self.waiting.append(connection)
+        self.metrics.inc("connections_total")
+        print(f"* Player connected from {address[0]} ({len(self.waiting)}/{PLAYERS_AMOUNT})")
+
+        if len(self.waiting) >= PLAYERS_AMOUNT:
+            connections = self.waiting[:PLAYERS_AMOUNT]
+            self.waiting = self.waiting[PLAYERS_AMOUNT:]
+            self.start_match(connections)
+
+    def drop_closed_connections(self) -> None:
+        """ Forget waiting players who disconnected, so they are not grouped into a match. """
+        for connection in list(self.waiting):
+            if is_connected(connection):
+                continue
+            self.waiting.remove(connection)
+            connection.close()
+            self.metrics.inc("disconnects_total")
+            print(f"* Waiting player disconnected ({len(self.waiting)}/{PLAYERS_AMOUNT})")
+
+    def start_match(self, connections: list[socket.socket]) -> None:
+        self.matches_count += 1
+        self.running_matches += 1
+        match_id = self.matches_count
+        print(f"* Starting match {match_id} (running: {self.running_matches})")
+        self.metrics.inc("matches_started_total")
+        self.metrics.set("matches_running", self.running_matches)
+
+        loop = asyncio.get_running_loop()
+        result = loop.run_in_executor(
+            self.pool, match.run_match,
+            match_id, connections, PLAYERS_AMOUNT, WORLD_SIZE, TICK_RATE, BULLET_SIMULATION,
+            self.collector.queue if self.collector is not None else None
+        )
+
+        def on_match_end(result: asyncio.Future) -> None:
+            # Sockets are duplicated into the worker, lobby copies are closed only now.
+            for connection in connections:
+                connection.close()
+            self.running_matches -= 1
+            self.metrics.set("matches_running", self.running_matches)
+
+            if result.exception() is not None:
+                self.metrics.inc("errors_total", kind="match")
+                if self.collector is not None:
+                    self.collector.discard(match_id)
+                print(f"ERROR: Match {match_id} failed: {result.exception()}")
+                return
+            print(f"* Match {match_id} finished, winner: {result.result() or '-'}")
+
+        result.add_done_callback(on_match_end)
+
+
+# Strong references of lobby's background tasks.
+background_tasks: set[asyncio.Task] = set()
+
+
+async def start_server():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(ADDRESS)
+    listener.listen()
+    listener.setblocking(False)
+    print(f"Server is listening on: {SERVER}:{PORT}")
+    print(f"Matches of {PLAYERS_AMOUNT} players, up to {MATCH_WORKERS} at once\n")
+
+    loop = asyncio.get_running_loop()
+    mp_context = multiprocessing.get_context("spawn")
+    collector = None
+    if METRICS_PORT:
+        # Manager queue can be passed to worker processes as an argument.
+        manager = mp_context.Manager()
+        collector = metrics.MetricsCollector(manager.Queue())
+        for coroutine in [collector.receive(), collector.dump(), collector.serve(METRICS_PORT)]:
+            background_tasks.add(asyncio.create_task(coroutine))
+
+    with ProcessPoolExecutor(MATCH_WORKERS, mp_context=mp_context) as pool:
+        lobby = Lobby(pool, collector)
+        while True:
+            connection, address = await loop.sock_accept(listener)
+            lobby.add_connection(connection, address)
+
+
+if __name__ == "__main__":
+    os.system("cls || clear")
+    asyncio.run(start_server())